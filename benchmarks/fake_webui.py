@@ -0,0 +1,238 @@
+"""
+Local stand-in for the webui API, good enough to drive the client without a GPU.
+Generation routes sleep for a configurable latency and answer with a pre-encoded PNG, progress
+follows the tasks that were started with `force_task_id`.
+
+    python benchmarks/fake_webui.py --port 7861 --latency 0.5 --image-size 1024x1024
+"""
+import argparse
+import base64
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+
+MODELS = [
+    {"title": "fake-v1.safetensors [0000000001]", "model_name": "fake-v1", "hash": "0000000001",
+     "sha256": None, "filename": "models/Stable-diffusion/fake-v1.safetensors", "config": None},
+    {"title": "fake-v2.safetensors [0000000002]", "model_name": "fake-v2", "hash": "0000000002",
+     "sha256": None, "filename": "models/Stable-diffusion/fake-v2.safetensors", "config": None},
+]
+
+
+class FakeWebUI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: tuple[str, int] = ("127.0.0.1", 0),
+            latency: float = 0.0,
+            model_switch_latency: float = 0.0,
+            image_size: tuple[int, int] = None
+        ):
+        """
+        `latency` is how long a generation takes, `image_size` fixes the size of returned
+        images, by default they follow the requested width and height.
+        """
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.model_switch_latency = model_switch_latency
+        self.image_size = image_size
+        self.options = {"sd_model_checkpoint": MODELS[0]["title"], "CLIP_stop_at_last_layers": 1}
+        self.requests: dict[str, int] = {}
+        self.interrupted = threading.Event()
+        self._tasks: dict[str, tuple[float, float]] = {}
+        self._finished: set[str] = set()
+        self._images: dict[tuple[int, int], str] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeWebUI":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-webui", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on a generation they gave up on is expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def image(self, width: int, height: int) -> str:
+        """Base64 PNG of the given size, encoded once so the server never becomes the bottleneck"""
+        size = self.image_size or (width, height)
+        with self._lock:
+            data = self._images.get(size)
+        if data is None:
+            img = Image.radial_gradient("L").resize(size).convert("RGB")
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG", compress_level=1)
+            data = base64.b64encode(buffer.getbuffer()).decode("ascii")
+            with self._lock:
+                self._images[size] = data
+        return data
+
+    def generate(self, payload: dict) -> dict:
+        task_id = payload.get("force_task_id")
+        start = time.monotonic()
+        if task_id:
+            with self._lock:
+                self._tasks[task_id] = (start, self.latency)
+
+        # sleep in slices so an interrupt cuts the generation short like the real thing
+        self.interrupted.clear()
+        while time.monotonic() - start < self.latency and not self.interrupted.is_set():
+            time.sleep(min(0.01, self.latency))
+
+        if task_id:
+            with self._lock:
+                self._tasks.pop(task_id, None)
+                self._finished.add(task_id)
+        count = payload.get("batch_size", 1) * payload.get("n_iter", 1)
+        data = self.image(payload.get("width", 512), payload.get("height", 512))
+        return {"images": [data] * count, "parameters": payload, "info": json.dumps({"seed": payload.get("seed", -1)})}
+
+    def progress(self, task_id: str | None) -> dict:
+        with self._lock:
+            running = dict(self._tasks)
+            finished = task_id in self._finished
+        if task_id is not None and task_id not in running:
+            # like the real /internal/progress, only tasks that ran to the end are completed,
+            # one that hasn't been submitted yet is simply not active
+            return {"active": False, "queued": False, "completed": finished, "progress": None,
+                    "eta": None, "live_preview": None, "id_live_preview": -1, "textinfo": None}
+
+        if task_id is None:
+            # the real endpoint compares the id with the running task's, so without one an idle
+            # webui (no current task either) comes back active and a busy one inactive
+            return {"active": not running, "queued": False, "completed": False, "progress": None,
+                    "eta": None, "live_preview": None, "id_live_preview": -1, "textinfo": None}
+
+        start, latency = running[task_id]
+        done = min(1.0, (time.monotonic() - start) / latency) if latency else 1.0
+        return {"active": True, "queued": False, "completed": False, "progress": done,
+                "eta": max(0.0, latency - (time.monotonic() - start)),
+                "live_preview": None, "id_live_preview": -1, "textinfo": None}
+
+    def state(self) -> dict:
+        """What /sdapi/v1/progress reports, the server wide view of the running job"""
+        with self._lock:
+            running = list(self._tasks.items())
+        progress, eta, job = 0.0, 0.0, ""
+        if running:
+            job, (start, latency) = running[0]
+            progress = min(1.0, (time.monotonic() - start) / latency) if latency else 1.0
+            eta = max(0.0, latency - (time.monotonic() - start))
+        return {
+            "progress": progress, "eta_relative": eta, "current_image": None, "textinfo": None,
+            "state": {"skipped": False, "interrupted": False, "job": job, "job_count": len(running),
+                      "job_timestamp": "0", "job_no": 0, "sampling_step": 0, "sampling_steps": 0},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, with Nagle on every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    server: FakeWebUI
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _send(self, obj, status: int = 200, started: float = None):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if started is not None:
+            # the real webui adds this header through its timing middleware
+            self.send_header("X-Process-Time", f"{time.perf_counter() - started:.6f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        started = time.perf_counter()
+        path = self.path.partition("?")[0]
+        self.server.count(path)
+        if path == "/sdapi/v1/sd-models":
+            self._send(MODELS, started=started)
+        elif path == "/sdapi/v1/options":
+            self._send(self.server.options, started=started)
+        elif path == "/sdapi/v1/progress":
+            self._send(self.server.state(), started=started)
+        else:
+            self._send({"detail": "Not Found"}, 404)
+
+    def do_POST(self):
+        started = time.perf_counter()
+        self.server.count(self.path)
+        payload = self._read_json()
+        if self.path in ("/sdapi/v1/img2img", "/sdapi/v1/txt2img"):
+            self._send(self.server.generate(payload), started=started)
+        elif self.path == "/sdapi/v1/options":
+            if payload.get("sd_model_checkpoint") not in (None, self.server.options["sd_model_checkpoint"]):
+                time.sleep(self.server.model_switch_latency)
+            self.server.options.update(payload)
+            self._send(None, started=started)
+        elif self.path == "/internal/progress":
+            self._send(self.server.progress(payload.get("id_task")), started=started)
+        elif self.path == "/sdapi/v1/interrupt":
+            self.server.interrupted.set()
+            self._send({}, started=started)
+        else:
+            self._send({"detail": "Not Found"}, 404)
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height or width)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serves a fake AUTOMATIC1111 webui API for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per generation")
+    parser.add_argument("--model-switch-latency", type=float, default=0.0, help="seconds per checkpoint swap")
+    parser.add_argument("--image-size", type=parse_size, help="WxH of returned images, defaults to the requested size")
+    args = parser.parse_args(argv)
+
+    server = FakeWebUI((args.host, args.port), args.latency, args.model_switch_latency, args.image_size)
+    print(f"Fake webui listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
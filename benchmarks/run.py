@@ -0,0 +1,337 @@
+"""
+Benchmarks for the client library against the local fake webui, no GPU needed.
+
+    pdm run bench -o bench.json
+    pdm run bench --only encode decode --repeat 50
+
+Every benchmark reports its numbers in one JSON document, so two runs can be diffed to see
+whether a change made the client faster or slower.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, memory is then only measured through tracemalloc
+    resource = None
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from PIL import Image
+from restore_automatic.client import SDClient
+from restore_automatic.codec import CodecPool
+from restore_automatic.request import GenerationRequest, JSONBody
+from restore_automatic.types import EncodeOptions
+from restore_automatic.utils import base64_to_pillowimg, bytes_to_pillowimg, encode_image
+from fake_webui import FakeWebUI, parse_size
+
+
+def summarize(samples: list[float]) -> dict:
+    """Milliseconds summary of a list of durations in seconds"""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def timed(func, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def sample_image(size: tuple[int, int]) -> Image.Image:
+    """Something that compresses like a photo rather than a flat fill"""
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    return Image.blend(Image.radial_gradient("L").resize(size).convert("RGB"), noise, 0.5)
+
+
+def bench_encode(args) -> dict:
+    img = sample_image(args.image_size)
+    results = {}
+    for name, options in {
+        "png_level1": EncodeOptions(compress_level=1),
+        "png_level6": EncodeOptions(compress_level=6),
+        "webp_lossless": EncodeOptions(format="WEBP"),
+    }.items():
+        encoded = encode_image(img, options)
+        results[name] = summarize(timed(lambda: encode_image(img, options), args.repeat))
+        results[name]["bytes"] = encoded.size
+    return results
+
+
+def bench_decode(args) -> dict:
+    encoded = encode_image(sample_image(args.image_size))
+    raw = io.BytesIO()
+    sample_image(args.image_size).save(raw, format="PNG", compress_level=1)
+    raw = raw.getvalue()
+    return {
+        "base64_to_pillowimg": summarize(timed(lambda: base64_to_pillowimg(encoded.data).load(), args.repeat)),
+        "bytes_to_pillowimg": summarize(timed(lambda: bytes_to_pillowimg(raw).load(), args.repeat)),
+    }
+
+
+def bench_codec(args) -> dict:
+    """Images per second encoded and decoded by that many threads, in the threads themselves and through a CodecPool"""
+    img = sample_image(args.image_size)
+    raw = io.BytesIO()
+    img.save(raw, format="PNG", compress_level=1)
+    raw = raw.getvalue()
+
+    def rate(func, workers: int) -> float:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: func(), range(args.jobs)))
+            return args.jobs / (time.perf_counter() - start)
+
+    results = {}
+    for workers in args.concurrency:
+        with CodecPool(workers) as pool:
+            # let every worker process start and import pillow before timing
+            list(pool.executor.map(abs, range(workers)))
+            results[str(workers)] = {
+                "encode_threads_per_s": rate(lambda: encode_image(img), workers),
+                "encode_pool_per_s": rate(lambda: pool.encode(img), workers),
+                "decode_threads_per_s": rate(lambda: bytes_to_pillowimg(raw).load(), workers),
+                "decode_pool_per_s": rate(lambda: pool.decode(raw), workers),
+            }
+    results["cpu_count"] = os.cpu_count()
+    return results
+
+
+def traced_peak(func) -> int:
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench_serialize(args) -> dict:
+    """Building a request body the old way, as one json.dumps document, against the streamed body"""
+    payload = GenerationRequest("bench", init_image=encode_image(sample_image(args.image_size))).payload()
+
+    def dumps():
+        json.dumps(payload, allow_nan=False).encode("utf-8")
+
+    def streamed():
+        for _ in JSONBody(payload):
+            pass
+
+    return {
+        "json_dumps": dict(summarize(timed(dumps, args.repeat)), peak_bytes=traced_peak(dumps)),
+        "streamed_body": dict(summarize(timed(streamed, args.repeat)), peak_bytes=traced_peak(streamed)),
+    }
+
+
+# each snippet prints time.time() once it reaches the point being measured
+STARTUP_SNIPPETS = {
+    "python": "import time; print(time.time())",
+    "import_restore_automatic": "import restore_automatic, time; print(time.time())",
+    "import_cli": "import restore_automatic.cli, time; print(time.time())",
+    "gui_window_shown": """
+import os, time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PySide6.QtWidgets import QApplication, QMessageBox
+import main
+# there is usually no webui to talk to here, the "not running" dialog would block forever
+QMessageBox.critical = lambda *args, **kwargs: None
+app = QApplication([])
+window = main.MainWindow()
+window.show()
+app.processEvents()
+print(time.time(), flush=True)
+os._exit(0)
+""",
+}
+
+
+def startup_time(snippet: str) -> float:
+    """Wall time from launching a fresh interpreter until the snippet prints its timestamp"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")])))
+    start = time.time()
+    result = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, env=env, cwd=SRC_DIR, check=True, timeout=120)
+    return float(result.stdout.split()[-1]) - start
+
+
+def bench_startup(args) -> dict:
+    """Cold start of the library, the batch runner's imports and the GUI up to its first frame"""
+    results = {}
+    for name, snippet in STARTUP_SNIPPETS.items():
+        try:
+            startup_time(snippet)
+        except subprocess.CalledProcessError as e:
+            # e.g. no PySide6 on a headless box
+            results[name] = {"error": e.stderr.strip().splitlines()[-1] if e.stderr.strip() else str(e)}
+            continue
+        results[name] = summarize([startup_time(snippet) for _ in range(args.repeat)])
+    return results
+
+
+def bench_round_trip(args, url: str) -> dict:
+    img = sample_image(args.image_size)
+    width, height = args.image_size
+    with SDClient(url) as client:
+        client.img2img(img, "warmup", width=width, height=height)
+        img2img = timed(lambda: client.img2img(img, "bench", width=width, height=height), args.repeat)
+        txt2img = timed(lambda: client.txt2img("bench", width=width, height=height), args.repeat)
+    return {
+        "server_latency_ms": None if args.server else args.latency * 1000,
+        "img2img": summarize(img2img),
+        "txt2img": summarize(txt2img),
+    }
+
+
+def bench_throughput(args, url: str) -> dict:
+    img = sample_image(args.image_size)
+    width, height = args.image_size
+    results = {}
+    for workers in args.concurrency:
+        with SDClient(url, pool_size=workers) as client, ThreadPoolExecutor(workers) as pool:
+            start = time.perf_counter()
+            futures = [
+                pool.submit(client.img2img, img, "bench", width=width, height=height)
+                for _ in range(args.jobs)
+            ]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+        results[str(workers)] = {"jobs": args.jobs, "seconds": elapsed, "images_per_second": args.jobs / elapsed}
+    return results
+
+
+def max_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def bench_memory(args, url: str) -> dict:
+    """
+    Python side peak of one call from tracemalloc, pillow's pixel buffers are not tracked there
+    so the process high water mark is reported as well.
+    """
+    img = sample_image(args.image_size)
+    width, height = args.image_size
+    results = {}
+    with SDClient(url) as client:
+        for name, call in {
+            "img2img": lambda: client.img2img(img, "bench", width=width, height=height),
+            "txt2img_batch4": lambda: client.txt2img("bench", width=width, height=height, batch_size=4),
+        }.items():
+            call()
+            rss_before = max_rss_bytes()
+            peak = traced_peak(call)
+            rss_after = max_rss_bytes()
+            results[name] = {
+                "tracemalloc_peak_bytes": peak,
+                "max_rss_growth_bytes": None if rss_before is None else rss_after - rss_before,
+            }
+    results["max_rss_bytes"] = max_rss_bytes()
+    return results
+
+
+BENCHMARKS = {
+    "encode": bench_encode,
+    "decode": bench_decode,
+    "serialize": bench_serialize,
+    "codec": bench_codec,
+    "startup": bench_startup,
+    "round_trip": bench_round_trip,
+    "throughput": bench_throughput,
+    "memory": bench_memory,
+}
+NEEDS_SERVER = {"round_trip", "throughput", "memory"}
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="restore-bench", description="Benchmarks the client library against a fake webui.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run, all by default")
+    parser.add_argument("--image-size", type=parse_size, default=(1024, 1024), help="WxH of test images")
+    parser.add_argument("--repeat", type=int, default=20, help="samples per timing")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake generation time in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="worker counts for throughput and codec")
+    parser.add_argument("--jobs", type=int, default=32, help="requests per throughput run")
+    parser.add_argument("--server", help="use an already running (fake or real) webui instead of starting one")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    selected = args.only or list(BENCHMARKS)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "image_size": list(args.image_size), "repeat": args.repeat, "latency": args.latency,
+            "concurrency": args.concurrency, "jobs": args.jobs, "server": args.server,
+        },
+        "results": {},
+    }
+
+    server = None
+    url = args.server
+    if url is None and NEEDS_SERVER.intersection(selected):
+        server = FakeWebUI(latency=args.latency).start()
+        url = server.url
+
+    try:
+        for name in selected:
+            print(f"running {name}...", file=sys.stderr)
+            if name in NEEDS_SERVER:
+                report["results"][name] = BENCHMARKS[name](args, url)
+            else:
+                report["results"][name] = BENCHMARKS[name](args)
+    finally:
+        if server is not None:
+            server.stop()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
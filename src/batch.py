@@ -0,0 +1,4 @@
+from restore_automatic.cli import main
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,21 +7,17 @@ from PySide6.QtWidgets import (
 )
 
 from PySide6.QtGui import QColor, QPalette
-from PySide6.QtCore import Qt, QThread, Signal
-from PySide6.QtGui import QKeyEvent, QPainter, QPixmap, QImage, QWheelEvent, QIcon
-import requests
+from PySide6.QtCore import Qt, Signal, QObject, QTimer
+from PySide6.QtGui import QKeyEvent, QPainter, QImage, QWheelEvent, QIcon
 
-from PIL import Image
-
-from typing import Literal
 
 from restore_automatic.layer_list import LayerList
-from restore_automatic import utils
-import restore_automatic as rp
+from restore_automatic.job_queue import GenerationQueue, GenerationJob, JobList
+from restore_automatic.presets import PRESETS
+from restore_automatic.tiled_image import TiledImageItem
+from restore_automatic.types import SDProgress, SDModel
 import os
 
-from pprint import pprint
-
 class ImageViewer(QGraphicsView):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -34,19 +30,22 @@ class ImageViewer(QGraphicsView):
         self.setResizeAnchor(QGraphicsView.AnchorViewCenter)
         self.zoom(1.0)
 
-        self.pixmap_img = None
-        self.pixmap_item = None
+        self.image_item = None
 
     def set_image(self, image):
+        if self.image_item is not None:
+            self.image_item.release()
         self.scene().clear()
-        self.pixmap_img = QPixmap.fromImage(image)
-        self.pixmap_item = self.scene().addPixmap(self.pixmap_img)
-        self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+        # drawn as tiles from a mip pyramid, only what is on screen becomes a pixmap
+        self.image_item = TiledImageItem(image)
+        self.scene().addItem(self.image_item)
+        self.scene().setSceneRect(self.image_item.boundingRect())
+        self.fitInView(self.image_item, Qt.KeepAspectRatio)
 
     def save_image(self, path):
-        if self.pixmap_img is None:
+        if self.image_item is None:
             return
-        self.pixmap_img.save(path)
+        self.image_item.image.save(path)
 
     def zoom(self, factor):
         self.scale(factor, factor)
@@ -61,7 +60,7 @@ class ImageViewer(QGraphicsView):
     def keyPressEvent(self, event: QKeyEvent) -> None:
         # on press home
         if event.key() == Qt.Key_Home:
-            self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+            self.fitInView(self.image_item, Qt.KeepAspectRatio)
 
 class SameLine(QFrame):
     def __init__(self, items: list):
@@ -75,33 +74,12 @@ class SameLine(QFrame):
         self.setLayout(lay)
 
 
-class GenerationThread(QThread):
-
-    GenTypes = Literal["img2img"] | Literal["txt2img"] | Literal["inpaint"]
-
-    generated = Signal(list)
-    failed = Signal(Exception)
+class BackendSignals(QObject):
+    """Hands updates from the library's background threads over to the UI thread"""
 
-    def __init__(self, gen_type: GenTypes, kwargs: dict):
-        super().__init__(None)
-        self.gen_type = gen_type
-        self.kwargs = kwargs
-
-    def run(self):
-        try:
-            if self.gen_type == "img2img":
-                results = rp.sd_img2img(**self.kwargs)     
-                self.generated.emit(results)
-            elif self.gen_type == "txt2img":
-                for item in ("base_img", "mask_path"):
-                    if item in self.kwargs:
-                        del self.kwargs[item]
-
-                results = rp.sd_txt2img(**self.kwargs)
-                self.generated.emit(results)
-            print("finished")
-        except Exception as e:
-            self.failed.emit(e)
+    progress = Signal(SDProgress)
+    models_changed = Signal(list)
+    models_failed = Signal(Exception)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -112,8 +90,35 @@ class MainWindow(QMainWindow):
 
         self.current_img_path = None
         self.image = None
+        self.mask = None
+        self.gen_queue = GenerationQueue(workers=2, parent=self)
+        self.gen_queue.result_ready.connect(self.generation_finished)
+        self.gen_queue.job_failed.connect(self.gen_failed)
+        self.gen_queue.job_changed.connect(self.job_changed)
         self._init_ui()
 
+        self.backend_signals = BackendSignals()
+        self.backend_signals.progress.connect(self.progress_updated)
+        self.backend_signals.models_changed.connect(self.models_changed)
+        self.backend_signals.models_failed.connect(self.models_failed)
+
+        self.progress_monitor = None
+        self.model_catalog = None
+        # runs once the event loop is up, so the window shows before anything talks to the backend
+        QTimer.singleShot(0, self.start_backend)
+
+    def start_backend(self):
+        from restore_automatic.progress import ProgressMonitor
+        from restore_automatic.catalog import ModelCatalog
+
+        self.progress_monitor = ProgressMonitor()
+        self.progress_monitor.subscribe(self.backend_signals.progress.emit)
+        self.progress_monitor.start()
+
+        self.model_catalog = ModelCatalog()
+        self.model_catalog.subscribe(self.backend_signals.models_changed.emit, self.backend_signals.models_failed.emit)
+        self.model_catalog.refresh(block=False)
+
     def _init_ui(self):
         self.init_menu()
 
@@ -169,7 +174,7 @@ class MainWindow(QMainWindow):
 
         self.presets_box = QComboBox()
         self.presets_box.setMinimumHeight(30)
-        self.presets_box.addItems(["Normal", "Restoration", "Upscaling"]) 
+        self.presets_box.addItems(["Normal", *PRESETS])
         self.presets_box.activated.connect(self.set_preset)
         contents.addWidget(self.presets_box)
 
@@ -219,6 +224,13 @@ class MainWindow(QMainWindow):
         contents.addLayout(wh_lay)
         contents.addWidget(SameLine([self.width_input, self.height_input]))
 
+        contents.addWidget(QLabel("Upscale passes:"))
+        self.passes_input = QSpinBox()
+        self.passes_input.setRange(1, 4)
+        self.passes_input.setValue(1)
+        self.passes_input.setToolTip("Reach the target size in several img2img passes, each upscaling a bit further")
+        contents.addWidget(self.passes_input)
+
         self.denoise_lbl = QLabel("Denoising Strength (0.3):")
         contents.addWidget(self.denoise_lbl)
         self.denoising_strength_input = QSlider(Qt.Horizontal)
@@ -254,6 +266,9 @@ class MainWindow(QMainWindow):
         self.prog.setVisible(False)
         contents.addWidget(self.prog)
 
+        self.job_list = JobList(self.gen_queue)
+        contents.addWidget(self.job_list)
+
         splitter.addWidget(self.layers)
         splitter.addWidget(self.image_viewer)
         splitter.addWidget(content_frame)
@@ -267,6 +282,9 @@ class MainWindow(QMainWindow):
         add_img.setIcon(QIcon.fromTheme("document-open"))
         add_img.setShortcut("Ctrl+O")
 
+        load_mask = file.addAction("Load Mask", self.load_mask)
+        load_mask.setShortcut("Ctrl+M")
+
         save_img = file.addAction("Save Image", self.save_image)
         save_img.setIcon(QIcon.fromTheme("document-save"))
         save_img.setShortcut("Ctrl+S")
@@ -278,9 +296,9 @@ class MainWindow(QMainWindow):
     def layer_item_pressed(self, item):
         if item:
             self.image = item.image
-            self.image_viewer.set_image(item.image)
-            self.width_input.setValue(item.image.width())
-            self.height_input.setValue(item.image.height())
+            self.image_viewer.set_image(self.image)
+            self.width_input.setValue(self.image.width())
+            self.height_input.setValue(self.image.height())
 
     def __update_wh(self, value):
         value = float(value.text()[:-1])
@@ -301,6 +319,16 @@ class MainWindow(QMainWindow):
             self.update_width_height(image.width(), image.height())
             self.layers.add_image(os.path.basename(file_path), image)
 
+    def load_mask(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Mask", "", "Image Files (*.png *.jpg *.jpeg)")
+        if file_path:
+            mask = QImage(file_path)
+            if mask.isNull():
+                QMessageBox.critical(self, "Error", "Could not open the mask")
+                return
+            self.mask = mask
+            self.inpaint_radio.setChecked(True)
+
     def save_image(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "Save Image", "", "Image Files (*.png *.jpg *.jpeg)")
         if file_path:
@@ -320,34 +348,55 @@ class MainWindow(QMainWindow):
         return input_
 
     def set_preset(self, _):
-        preset = self.presets_box.currentText()
-        if preset == "Restoration" or "Upscaling":
-            self.prompt_input.setText(utils.DEFAULT_RESTORE_PROMPT)
-            self.neg_prompt_input.setText(utils.DEFAULT_RESTORE_NEGATIVE_PROMPT)
+        preset = PRESETS.get(self.presets_box.currentText())
+        if preset is not None:
+            self.prompt_input.setText(preset.prompt)
+            self.neg_prompt_input.setText(preset.negative_prompt)
             self.img2img_radio.setChecked(True)
             self.txt2img_radio.setChecked(False)
             self.inpaint_radio.setChecked(False)
-            self.denoising_strength_input.setValue(30 if preset == "Restoration" else 5)
+            self.denoising_strength_input.setValue(round(preset.denoising_strength * 100))
 
     def reset_wh(self):
         self.update_width_height(self.image.width(), self.image.height())
 
-    def generation_finished(self, images: list[Image.Image]):
-        self.prog.setVisible(False)
+    def progress_updated(self, update: SDProgress):
+        self.gen_queue.progress_updated(update)
+        if not update.active:
+            return
+        self.prog.setRange(0, 100)
+        self.prog.setValue(round(update.progress * 100))
+        self.prog.setFormat(f"%p% ({update.eta_relative:.0f}s left)")
+
+    def job_changed(self, job: GenerationJob):
+        if job.finished and job.task_id is not None:
+            self.progress_monitor.unwatch(job.task_id)
+
+        if not self.gen_queue.outstanding:
+            self.prog.setVisible(False)
+        elif not self.prog.isVisible():
+            # indeterminate until the backend starts reporting on a task
+            self.prog.setRange(0, 0)
+            self.prog.setVisible(True)
+
+    def generation_finished(self, job: GenerationJob, images: list[QImage]):
         if images:
-            self.image = images[0].toqimage()
+            self.image = images[0]
             self.image_viewer.set_image(self.image)
             self.layers.add_image("generated", self.image)
             self.update_width_height(self.image.width(), self.image.height())
         else:
             print("Got 0 images")
 
-    def gen_failed(self, err):
-        self.prog.setVisible(False)
-        print("Generation failed")
+    def gen_failed(self, job: GenerationJob, err: Exception):
+        print(f"Generation #{job.id} failed")
         print(err)
 
     def generate(self):
+        from pprint import pprint
+        from restore_automatic.progress import new_task_id
+        from restore_automatic.pipeline import plan_passes
+
         if self.image is None:
             QMessageBox.critical(self, "Error", "No image selected")
 
@@ -362,7 +411,7 @@ class MainWindow(QMainWindow):
         restore_faces = self.restore_faces_chk.isChecked()
 
         kwargs = {
-            "base_img": Image.fromqimage(self.image),
+            "base_img": self.image,
             "prompt": prompt,
             "negative_prompt": neg_prompt,
             "model_name": model,
@@ -384,31 +433,52 @@ class MainWindow(QMainWindow):
         elif self.img2img_radio.isChecked():
             gen_type = "img2img"
         elif self.inpaint_radio.isChecked():
+            if self.mask is None:
+                QMessageBox.critical(self, "Error", "Load a mask first, white marks what gets repainted")
+                return
             gen_type = "inpaint"
+            kwargs["mask_path"] = self.mask
         else:
             gen_type = "txt2img"
 
-        self.prog.setVisible(True)
-        self.gen_thread = GenerationThread(gen_type, kwargs)
-        self.gen_thread.generated.connect(self.generation_finished)
-        self.gen_thread.failed.connect(self.gen_failed)
-        self.gen_thread.start()
+        passes = self.passes_input.value()
+        if gen_type == "img2img" and passes > 1:
+            # every pass is its own backend task, so there is no single task id to follow
+            gen_type = "upscale"
+            kwargs["passes"] = plan_passes(width / self.image.width(), passes, denoising_strength, steps, cfg_scale)
+            self.gen_queue.submit(gen_type, kwargs)
+            return
+
+        kwargs["task_id"] = new_task_id()
+        self.progress_monitor.watch(kwargs["task_id"])
+        self.gen_queue.submit(gen_type, kwargs)
 
     def stop_generation(self):
-        res = rp.sd_interrupt()
-        print(res)
-        self.prog.setVisible(False)
+        self.gen_queue.cancel_all()
 
     def refresh_models(self):
-        try:
-            models = rp.sd_list_models()
-            names = []
-            for m in models:
-                names.append(m["model_name"])
-
-            self.models_box.addItems(names)
-        except requests.exceptions.ConnectionError as e:
+        if self.model_catalog is not None:
+            self.model_catalog.refresh(block=False)
+
+    def models_changed(self, models: list[SDModel]):
+        current = self.models_box.currentText()
+        self.models_box.clear()
+        self.models_box.addItems([m.model_name for m in models])
+        if current:
+            self.models_box.setCurrentText(current)
+
+    def models_failed(self, err: Exception):
+        import requests
+        if isinstance(err, requests.exceptions.ConnectionError):
             QMessageBox.critical(self, "Error", "AUTOMATIC1111 webui is not running. Please start it first.")
+        else:
+            QMessageBox.critical(self, "Error", f"Could not load models: {err}")
+
+    def closeEvent(self, event):
+        if self.progress_monitor is not None:
+            self.progress_monitor.stop()
+        self.layers.close_store()
+        super().closeEvent(event)
 
 def set_custom_fusion_theme(app, primary_color, secondary_color, text_color):
     app.setStyle("Fusion")
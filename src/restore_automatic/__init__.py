@@ -1,69 +1,131 @@
-import requests
-from pprint import pprint
-from .types import EndPoints
-from .utils import *
-from PIL.Image import Image
+"""
+Client library for the AUTOMATIC1111 webui api.
+Everything below is imported on first use, so `import restore_automatic` stays cheap and a
+script only pays for requests, pillow or httpx once it actually touches them.
+"""
+from __future__ import annotations
+import importlib
+from typing import TYPE_CHECKING
+from .types import EndPoints, UpscalePass
+from .request import DEFAULT_NEGATIVES, GenerationRequest
+
+if TYPE_CHECKING:
+    from PIL.Image import Image
+
+# public name -> submodule it lives in
+_LAZY = {
+    "SDClient": "client",
+    "DeadlineExceeded": "client",
+    "get_default_client": "client",
+    "set_default_client": "client",
+    "AsyncSDClient": "aio",
+    "BackendScheduler": "scheduler",
+    "NoBackendAvailable": "scheduler",
+    "tiled_img2img": "tiling",
+    "progressive_upscale": "pipeline",
+    "plan_passes": "pipeline",
+    "bounded_inpaint": "inpaint",
+    "sweep": "sweep",
+    "plan_sweep": "sweep",
+    "contact_sheet": "sweep",
+    "ResultCache": "cache",
+    "CodecPool": "codec",
+    "ModelAffinityQueue": "model_queue",
+    "ModelCatalog": "catalog",
+    "CallMetrics": "metrics",
+    "MetricsRecorder": "metrics",
+    "JSONLinesExporter": "metrics",
+    "DEFAULT_RESTORE_PROMPT": "utils",
+    "DEFAULT_RESTORE_NEGATIVE_PROMPT": "utils",
+    "img2base64": "utils",
+    "base64_to_bytes": "utils",
+    "save_image": "utils",
+    "bytes_to_pillowimg": "utils",
+    "base64_to_pillowimg": "utils",
+    "pillowimg_to_base64": "utils",
+    "encode_image": "utils",
+}
+
+__all__ = [
+    "EndPoints", "UpscalePass", "DEFAULT_NEGATIVES", "GenerationRequest", *_LAZY,
+    "sd_inpaint", "sd_img2img", "sd_txt2img", "set_model", "get_progress", "sd_list_models", "sd_interrupt",
+]
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY))
+
+
+def _default_client():
+    from .client import get_default_client
+    return get_default_client()
 
-DEFAULT_NEGATIVES = "lowres, bad anatomy, bad hands, text, error, missing fingers, extra digit, fewer digits, cropped, worst quality, low quality, normal quality, jpeg artifacts, signature, watermark, username, blurry"
 
 def sd_inpaint(
         base_img_path: str | Image,
-        mask_path: str | Image, 
-        prompt: str, 
-        model_name: str = None, 
+        mask_path: str | Image,
+        prompt: str,
+        model_name: str = None,
         negative_prompt: str = DEFAULT_NEGATIVES,
         restore_faces: bool = False,
-        steps=10, 
+        steps=10,
         cfg_scale=7,
         denoising_strength=7.5,
-        width=512,
-        height=512,
+        width=None,
+        height=None,
         batch_size=2,
         seed=-1,
-        CLIP_stop_at_last_layers=2
-    ):
-
-    payload = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "steps": steps,
-        "mask": img2base64(mask_path) if type(mask_path) == str else pillowimg_to_base64(mask_path),
-        "batch_size": batch_size,
-        "mask_blur_x": 0,
-        "mask_blur_y": 0,
-        "mask_blur": 0,
-        "width": width,
-        "height": height,
-        "cfg_scale": cfg_scale,
-        "seed": seed,
-        "denoising_strength": denoising_strength,
-        "seed": seed,
-        "restore_faces": restore_faces
-    }
-
-    if model_name is not None:
-        payload["override_settings"] = {
-            "sd_model_checkpoint": model_name,
-            "CLIP_stop_at_last_layers": CLIP_stop_at_last_layers,
-        }
-
-    if type(base_img_path) == str:    
-        payload["init_images"] = [img2base64(base_img_path)]
-    else:
-        payload["init_images"] = [pillowimg_to_base64(base_img_path)]
-
-    response = requests.post(url=EndPoints.IMG2IMG, json=payload)
-    jsn = response.json()
-    pprint(jsn["parameters"])
-    print(len(jsn["images"]))
-    save_image(jsn["images"][0], "generated_img2img.png")
+        CLIP_stop_at_last_layers=2,
+        deadline: float = None,
+        *,
+        padding=32,
+        resolution=512
+    ) -> list[Image]:
+    """
+    Inpaints only the masked region, see `bounded_inpaint`. The generation size follows the
+    mask's crop and `resolution`, `width` and `height` are ignored and only kept so positional
+    callers still line up.
+    """
+    if width is not None or height is not None:
+        import warnings
+        warnings.warn(
+            "sd_inpaint ignores width and height, the size comes from the mask, pass resolution= instead",
+            DeprecationWarning, stacklevel=2
+        )
+    from .inpaint import bounded_inpaint
+    return bounded_inpaint(
+        base_img_path,
+        mask_path,
+        prompt,
+        padding=padding,
+        resolution=resolution,
+        model_name=model_name,
+        negative_prompt=negative_prompt,
+        restore_faces=restore_faces,
+        steps=steps,
+        cfg_scale=cfg_scale,
+        denoising_strength=denoising_strength,
+        batch_size=batch_size,
+        seed=seed,
+        CLIP_stop_at_last_layers=CLIP_stop_at_last_layers,
+        deadline=deadline
+    )
 
 def sd_img2img(
-        base_img: str | Image, 
-        prompt: str, 
+        base_img: str | Image,
+        prompt: str,
         negative_prompt: str = DEFAULT_NEGATIVES,
-        model_name: str = None, 
-        steps=10, 
+        model_name: str = None,
+        steps=10,
         cfg_scale=7,
         denoising_strength=7.5,
         width=512,
@@ -71,45 +133,31 @@ def sd_img2img(
         restore_faces: bool = False,
         batch_size=2,
         seed=-1,
-        CLIP_stop_at_last_layers=2
+        CLIP_stop_at_last_layers=2,
+        deadline: float = None
     ) -> list[Image]:
-    payload = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "steps": steps,
-        "batch_size": batch_size,
-        "width": width,
-        "height": height,
-        "cfg_scale": cfg_scale,
-        "seed": seed,
-        "denoising_strength": denoising_strength,
-        "restore_faces": restore_faces
-    }
-
-    if model_name is not None:
-        payload["override_settings"] = {
-            "sd_model_checkpoint": model_name,
-            "CLIP_stop_at_last_layers": CLIP_stop_at_last_layers,
-        }
-
-    if type(base_img) == str:    
-        payload["init_images"] = [img2base64(base_img)]
-    else:
-        payload["init_images"] = [pillowimg_to_base64(base_img)]
-
-    response = requests.post(url=EndPoints.IMG2IMG, json=payload)
-    jsn = response.json()
-    images = [] 
-    for im in jsn["images"]:
-        images.append(base64_to_pillowimg(im))
-
-    return images
+    return _default_client().img2img(
+        base_img,
+        prompt,
+        negative_prompt=negative_prompt,
+        model_name=model_name,
+        steps=steps,
+        cfg_scale=cfg_scale,
+        denoising_strength=denoising_strength,
+        width=width,
+        height=height,
+        restore_faces=restore_faces,
+        batch_size=batch_size,
+        seed=seed,
+        CLIP_stop_at_last_layers=CLIP_stop_at_last_layers,
+        deadline=deadline
+    )
 
 def sd_txt2img(
         prompt: str,
         negative_prompt: str = DEFAULT_NEGATIVES,
-        model_name: str = None, 
-        steps=10, 
+        model_name: str = None,
+        steps=10,
         cfg_scale=7,
         denoising_strength=7.5,
         width=512,
@@ -117,69 +165,34 @@ def sd_txt2img(
         batch_size=2,
         restore_faces: bool = False,
         seed=-1,
-        CLIP_stop_at_last_layers=2
+        CLIP_stop_at_last_layers=2,
+        deadline: float = None
     ) -> list[Image]:
-
-    payload = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "steps": steps,
-        "batch_size": batch_size,
-        "width": width,
-        "height": height,
-        "cfg_scale": cfg_scale,
-        "denoising_strength": denoising_strength,
-        "seed": seed,
-        "restore_faces": restore_faces
-    }
-
-    if model_name is not None:
-        payload["override_settings"] = {
-            "sd_model_checkpoint": model_name,
-            "CLIP_stop_at_last_layers": CLIP_stop_at_last_layers,
-            "show_progress_every_n_steps": int('1')
-        }
-
-    response = requests.post(url=EndPoints.TXT2IMG, json=payload)
-    jsn = response.json()
-    images = [] 
-    for im in jsn["images"]:
-        images.append(base64_to_pillowimg(im))
-
-    return images
+    return _default_client().txt2img(
+        prompt,
+        negative_prompt=negative_prompt,
+        model_name=model_name,
+        steps=steps,
+        cfg_scale=cfg_scale,
+        denoising_strength=denoising_strength,
+        width=width,
+        height=height,
+        batch_size=batch_size,
+        restore_faces=restore_faces,
+        seed=seed,
+        CLIP_stop_at_last_layers=CLIP_stop_at_last_layers,
+        deadline=deadline
+    )
 
 def set_model(model_name: str):
-    modeldata = {
-        "sd_model_checkpoint": model_name,
-        "show_progress_every_n_steps": int('1')
-    }
-
-    paramheaders = {
-        "accept": "application/json",
-        "Content-Type": "application/json"
-    }
-    paramresponse = requests.post(url=EndPoints.OPTIONS, headers=paramheaders, json=modeldata)
-    if paramresponse.status_code != 200:
-        raise Exception("Could not set model. Error: " + paramresponse.text)
-    
+    _default_client().set_model(model_name)
+
 
 def get_progress():
-    payload = {
-        # "id_task": "string",a
-        # "id_live_preview": -1,
-        # "live_preview": True,
-        "skip_current_image": "false",
-        "skip_current_text": "true"
-    }
-    response = requests.post(url=EndPoints.PROGRESS, json=payload)
-    jsn = response.json()
-    return jsn
+    return _default_client().get_progress()
 
 def sd_list_models() -> list:
-    model_resp = requests.get(EndPoints.MODELS)
-    models = model_resp.json()
-    return models
+    return _default_client().list_models()
 
 def sd_interrupt():
-    resp = requests.post(url=EndPoints.INTERRUPT)
-    return resp.status_code == 200
\ No newline at end of file
+    return _default_client().interrupt()
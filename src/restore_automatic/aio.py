@@ -0,0 +1,336 @@
+"""
+asyncio counterpart of `SDClient`.
+Lets a single event loop drive many in-flight generations, progress polls and
+interrupts over one connection pool instead of a thread per request.
+Needs the optional `httpx` dependency (`pdm install -G async`).
+"""
+import asyncio
+import base64
+import json
+import time
+from typing import TYPE_CHECKING, Callable, AsyncIterator
+from PIL.Image import Image
+from .types import EndPoints, Routes, EncodeOptions, EncodedImage
+from .client import (
+    DEFAULT_TIMEOUT, DEFAULT_SHORT_TIMEOUT, DeadlineExceeded,
+    ImageDecoder, _ClientCore, build_progress_payload, deadline_at, response_image_bytes
+)
+from .request import GenerationRequest, JSONBody
+from .cache import ResultCache
+from .streaming import JSONArrayScanner
+from .metrics import CallMetrics, MetricsHook, server_time
+
+if TYPE_CHECKING:
+    from .codec import CodecPool
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+async def _stream(body: JSONBody) -> AsyncIterator[bytes]:
+    # httpx only streams async iterables from an AsyncClient
+    for chunk in body:
+        yield chunk
+
+
+async def _within(awaitable, due: float | None, message: str):
+    """Awaits `awaitable`, raising `DeadlineExceeded` once the `time.monotonic()` deadline `due` passes"""
+    if due is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, due - time.monotonic()))
+    except TimeoutError:
+        raise DeadlineExceeded(message) from None
+
+
+def _httpx_timeout(timeout: float | tuple[float, float]):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class AsyncSDClient(_ClientCore):
+    """
+    Pooled asyncio connection to a single webui backend. Encoding, response parsing and
+    decoding run in worker threads, so a large image never stalls the other calls on the loop.
+    With a `codec` pool they run in its worker processes and the loop awaits their futures.
+    """
+
+    def __init__(
+            self,
+            base_url: str = EndPoints.BASE,
+            pool_size: int = 10,
+            timeout: float | tuple[float, float] = DEFAULT_TIMEOUT,
+            short_timeout: float | tuple[float, float] = DEFAULT_SHORT_TIMEOUT,
+            cache: ResultCache = None,
+            encode_options: EncodeOptions = None,
+            on_encode: Callable[[EncodedImage], None] = None,
+            image_decoder: ImageDecoder = None,
+            on_metrics: MetricsHook = None,
+            codec: "CodecPool" = None
+        ):
+        if httpx is None:
+            raise ImportError("AsyncSDClient requires httpx, install it with `pdm install -G async`")
+
+        super().__init__(base_url, cache, encode_options, on_encode, image_decoder, on_metrics, codec)
+        self._abandoning: set[asyncio.Task] = set()
+        self.timeout = _httpx_timeout(timeout)
+        self.short_timeout = _httpx_timeout(short_timeout)
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"accept": "application/json"},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=self.timeout
+        )
+
+    def __repr__(self) -> str:
+        return f"AsyncSDClient({self.base_url!r})"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.http.aclose()
+
+    async def _send(self, route: str, payload: dict, metrics: CallMetrics, due: float = None) -> tuple["httpx.Response", float]:
+        if due is not None and due <= time.monotonic():
+            raise DeadlineExceeded(f"Deadline passed before {route} was sent")
+        start = time.perf_counter()
+        body = JSONBody(payload)
+        sent = time.perf_counter()
+        metrics.serialize = sent - start
+        metrics.request_bytes = len(body)
+
+        # with the length given up front httpx sends a plain body instead of a chunked one
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+        request = self.http.build_request("POST", route, content=_stream(body), headers=headers)
+        response = await _within(self.http.send(request, stream=True), due, f"{route} got no response before its deadline")
+        headers_at = time.perf_counter()
+        metrics.status = response.status_code
+        metrics.server = server_time(response.headers)
+        metrics.upload = max(0.0, headers_at - sent - (metrics.server or 0.0))
+        return response, headers_at
+
+    async def generate(self, route: str, payload: dict, metrics: CallMetrics = None, due: float = None) -> dict:
+        metrics = metrics or CallMetrics(route, self.base_url)
+        response, headers_at = await self._send(route, payload, metrics, due)
+        try:
+            response.raise_for_status()
+            content = await _within(response.aread(), due, f"{route} was still downloading at its deadline")
+        finally:
+            await response.aclose()
+        parse_start = time.perf_counter()
+        metrics.download = parse_start - headers_at
+        metrics.response_bytes = len(content)
+        jsn = await asyncio.to_thread(json.loads, content)
+        metrics.parse = time.perf_counter() - parse_start
+        return jsn
+
+    async def interrupt_task(self, task_id: str) -> bool:
+        """Interrupts the backend only if it is working on `task_id` right now"""
+        progress = await self.get_progress(task_id)
+        if progress.get("active"):
+            return await self.interrupt()
+        return False
+
+    def _abandon(self, payload: dict) -> None:
+        """Stops a generation nobody waits for anymore, when it was sent with a task id to check against"""
+        task_id = payload.get("force_task_id")
+        if task_id is None:
+            return
+
+        async def interrupt():
+            try:
+                await self.interrupt_task(task_id)
+            except (httpx.HTTPError, ValueError):
+                pass
+        # the loop only keeps weak references to tasks
+        task = asyncio.ensure_future(interrupt())
+        self._abandoning.add(task)
+        task.add_done_callback(self._abandoning.discard)
+
+    async def encode(self, img: str | Image | EncodedImage, metrics: CallMetrics = None) -> EncodedImage:
+        if isinstance(img, EncodedImage):
+            return img
+        if self.codec is not None:
+            encoded = await asyncio.wrap_future(self.codec.submit_encode(img, self.encode_options))
+        else:
+            encoded = await asyncio.to_thread(self._encode_image, img)
+        return self._encoded(encoded, metrics)
+
+    def _pooled(self, decoder: ImageDecoder) -> bool:
+        return self.codec is not None and decoder == self.codec.decode
+
+    async def _decode_one(self, image_bytes: bytes, decoder: ImageDecoder):
+        if self._pooled(decoder):
+            return await asyncio.wrap_future(self.codec.submit_decode(image_bytes))
+        return await asyncio.to_thread(decoder, image_bytes)
+
+    async def _decode(self, raw: list[bytes], decoder: ImageDecoder, metrics: CallMetrics) -> list:
+        if self._pooled(decoder):
+            start = time.perf_counter()
+            images = await asyncio.gather(*(self._decode_one(b, decoder) for b in raw))
+            return self._decoded(images, time.perf_counter() - start, metrics)
+        return self._decoded(*await asyncio.to_thread(self._decode_all, raw, decoder), metrics)
+
+    async def generate_images(self, route: str, payload: dict, decoder: ImageDecoder = None, metrics: CallMetrics = None, due: float = None) -> list:
+        """Past `due`, an absolute `time.monotonic()` deadline, raises `DeadlineExceeded` like `SDClient.generate_images`"""
+        decoder = decoder or self.image_decoder
+        metrics = metrics or CallMetrics(route, self.base_url)
+        try:
+            key = self._cache_key(route, payload)
+            if key is not None:
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    metrics.cached = True
+                    images = await self._decode(cached, decoder, metrics)
+                    self._report(metrics)
+                    return images
+
+            jsn = await self.generate(route, payload, metrics, due)
+            raw = await asyncio.to_thread(response_image_bytes, jsn)
+            if key is not None:
+                await asyncio.to_thread(self.cache.put, key, raw)
+            images = await self._decode(raw, decoder, metrics)
+        except DeadlineExceeded as e:
+            self._abandon(payload)
+            self._report(metrics, e)
+            raise
+        except Exception as e:
+            self._report(metrics, e)
+            raise
+        self._report(metrics)
+        return images
+
+    async def iter_generate(self, route: str, payload: dict, metrics: CallMetrics = None, due: float = None) -> AsyncIterator[bytes]:
+        """Streams a generation and yields each encoded image as soon as it has been read"""
+        metrics = metrics or CallMetrics(route, self.base_url)
+        metrics.streamed = True
+        key = self._cache_key(route, payload)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                metrics.cached = True
+                for image_bytes in cached:
+                    yield image_bytes
+                return
+
+        raw = []
+        scanner = JSONArrayScanner("images")
+        response, headers_at = await self._send(route, payload, metrics, due)
+        paused = 0.0
+        try:
+            response.raise_for_status()
+            chunks = response.aiter_bytes()
+            while True:
+                try:
+                    chunk = await _within(anext(chunks), due, f"{route} was still downloading at its deadline")
+                except StopAsyncIteration:
+                    break
+                metrics.response_bytes += len(chunk)
+                for b64 in scanner.feed(chunk):
+                    image_bytes = await asyncio.to_thread(base64.b64decode, b64)
+                    if key is not None:
+                        raw.append(image_bytes)
+                    yielded = time.perf_counter()
+                    yield image_bytes
+                    paused += time.perf_counter() - yielded
+        finally:
+            await response.aclose()
+        metrics.download = time.perf_counter() - headers_at - paused
+
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, raw)
+
+    async def _iter_images(self, route: str, payload: dict, decoder: ImageDecoder, metrics: CallMetrics, due: float = None) -> AsyncIterator:
+        decoder = decoder or self.image_decoder
+        error = None
+        try:
+            async for image_bytes in self.iter_generate(route, payload, metrics=metrics, due=due):
+                start = time.perf_counter()
+                image = await self._decode_one(image_bytes, decoder)
+                metrics.decode += time.perf_counter() - start
+                metrics.images += 1
+                yield image
+        except DeadlineExceeded as e:
+            self._abandon(payload)
+            error = e
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._report(metrics, error)
+
+    async def send(self, request: GenerationRequest, decoder: ImageDecoder = None, deadline: float = None) -> list:
+        """Runs a prepared `GenerationRequest` on its route"""
+        due = deadline_at(deadline)
+        return await self.generate_images(request.route, request.payload(), decoder, CallMetrics(request.route, self.base_url), due)
+
+    async def iter_img2img(self, base_img: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> AsyncIterator:
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        payload = GenerationRequest(prompt, init_image=await self.encode(base_img, metrics), **kwargs).payload()
+        async for image in self._iter_images(Routes.IMG2IMG, payload, decoder, metrics, due):
+            yield image
+
+    def iter_txt2img(self, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> AsyncIterator:
+        due = deadline_at(deadline)
+        payload = GenerationRequest(prompt, **kwargs).payload()
+        return self._iter_images(Routes.TXT2IMG, payload, decoder, CallMetrics(Routes.TXT2IMG, self.base_url), due)
+
+    async def img2img(self, base_img: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> list:
+        """`deadline` is the number of seconds the whole call may take, including the upload"""
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        payload = GenerationRequest(prompt, init_image=await self.encode(base_img, metrics), **kwargs).payload()
+        return await self.generate_images(Routes.IMG2IMG, payload, decoder, metrics, due)
+
+    async def txt2img(self, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> list:
+        due = deadline_at(deadline)
+        payload = GenerationRequest(prompt, **kwargs).payload()
+        return await self.generate_images(Routes.TXT2IMG, payload, decoder, due=due)
+
+    async def inpaint(self, base_img_path: str | Image | EncodedImage, mask_path: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> list:
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        init_image, mask = await asyncio.gather(self.encode(base_img_path, metrics), self.encode(mask_path, metrics))
+        payload = GenerationRequest(prompt, init_image=init_image, mask=mask, **kwargs).payload()
+        return await self.generate_images(Routes.IMG2IMG, payload, decoder, metrics, due)
+
+    async def set_model(self, model_name: str, CLIP_stop_at_last_layers: int = None) -> None:
+        modeldata = {
+            "sd_model_checkpoint": model_name,
+            "show_progress_every_n_steps": int('1')
+        }
+        if CLIP_stop_at_last_layers is not None:
+            modeldata["CLIP_stop_at_last_layers"] = CLIP_stop_at_last_layers
+        paramresponse = await self.http.post(Routes.OPTIONS, json=modeldata)
+        if paramresponse.status_code != 200:
+            raise Exception("Could not set model. Error: " + paramresponse.text)
+        self.loaded_model = (model_name, CLIP_stop_at_last_layers)
+
+    async def get_progress(self, id_task: str = None, id_live_preview: int = -1, live_preview: bool = False) -> dict:
+        payload = build_progress_payload(id_task, id_live_preview, live_preview)
+        response = await self.http.post(Routes.PROGRESS, json=payload, timeout=self.short_timeout)
+        return response.json()
+
+    async def get_state(self) -> dict:
+        """Like `SDClient.get_state`"""
+        response = await self.http.get(Routes.STATE, timeout=self.short_timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def list_models(self) -> list:
+        model_resp = await self.http.get(Routes.MODELS, timeout=self.short_timeout)
+        return model_resp.json()
+
+    async def interrupt(self) -> bool:
+        resp = await self.http.post(Routes.INTERRUPT, timeout=self.short_timeout)
+        return resp.status_code == 200
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from .request import IMAGE_FIELDS, BODY_CHUNK_SIZE
+
+# payload fields that don't change what gets generated, a hedged call sets a fresh task id every time
+_UNKEYED_FIELDS = ("force_task_id",)
+
+
+def _digest(img: str | bytes) -> bytes:
+    if isinstance(img, bytes):
+        return hashlib.sha256(img).digest()
+    # hashed a chunk at a time so the base64 string is never copied whole
+    h = hashlib.sha256()
+    for start in range(0, len(img), BODY_CHUNK_SIZE):
+        h.update(img[start:start + BODY_CHUNK_SIZE].encode())
+    return h.digest()
+
+
+class ResultCache:
+    """
+    On-disk cache of generation results keyed by the init image and request parameters.
+    Only requests with a fixed seed are cached since those are the only deterministic ones.
+    Entries are evicted least recently used first once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def __repr__(self) -> str:
+        return f"ResultCache({self.directory!r}, entries={len(self._entries)}, size={self._size})"
+
+    def _load_index(self) -> None:
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.isdir(path):
+                files = [os.path.join(path, f) for f in os.listdir(path)]
+                found.append((os.path.getmtime(path), name, sum(os.path.getsize(f) for f in files)))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    @staticmethod
+    def is_cacheable(payload: dict) -> bool:
+        return payload.get("seed", -1) != -1
+
+    @staticmethod
+    def key(route: str, payload: dict, model: tuple | None = None) -> str:
+        """
+        `model` is what the backend was switched to through `set_model`, it is part of the key
+        for payloads that don't pin a checkpoint through `override_settings` themselves.
+        """
+        h = hashlib.sha256(route.encode())
+        if model is not None and "override_settings" not in payload:
+            h.update(b"\0model\0" + json.dumps(list(model)).encode())
+        for field in IMAGE_FIELDS:
+            value = payload.get(field)
+            if isinstance(value, str):
+                value = [value]
+            for img in value or ():
+                h.update(b"\0" + field.encode() + b"\0")
+                h.update(_digest(img))
+
+        params = {k: v for k, v in payload.items() if k not in IMAGE_FIELDS and k not in _UNKEYED_FIELDS}
+        h.update(json.dumps(params, sort_keys=True, separators=(",", ":")).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> list[bytes] | None:
+        """Returns the encoded images of a cached result, or None on a miss"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        path = self._path(key)
+        try:
+            names = sorted(os.listdir(path), key=lambda n: int(os.path.splitext(n)[0]))
+            images = []
+            for name in names:
+                with open(os.path.join(path, name), "rb") as f:
+                    images.append(f.read())
+            os.utime(path)
+        except OSError:
+            # removed behind our back, treat it as a miss
+            with self._lock:
+                self._forget(key)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return images
+
+    def put(self, key: str, images: list[bytes]) -> None:
+        path = self._path(key)
+        tmp_path = path + f".{threading.get_ident()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for i, data in enumerate(images):
+            with open(os.path.join(tmp_path, f"{i}.png"), "wb") as f:
+                f.write(data)
+
+        size = sum(len(data) for data in images)
+        with self._lock:
+            if key in self._entries:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                self._entries.move_to_end(key)
+                return
+            os.replace(tmp_path, path)
+            self._entries[key] = size
+            self._size += size
+            self._evict()
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, _ = next(iter(self._entries.items()))
+            self._forget(key)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                shutil.rmtree(self._path(key), ignore_errors=True)
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
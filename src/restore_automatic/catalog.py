@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Callable
+import requests
+from .client import SDClient, get_default_client
+from .types import SDModel
+
+ModelsCallback = Callable[[list[SDModel]], None]
+ErrorCallback = Callable[[Exception], None]
+
+
+class ModelCatalog:
+    """
+    Cached, deduplicated view of the backend's checkpoints.
+    Reads are served from memory, once the list is older than `ttl` seconds a read returns the
+    cached list and refreshes it in the background. Subscribers are told whenever the list changes.
+    """
+
+    def __init__(self, client: SDClient = None, ttl: float = 300.0):
+        self.client = client or get_default_client()
+        self.ttl = ttl
+        self.last_error: Exception | None = None
+
+        self._models: list[SDModel] = []
+        self._index: dict[str, SDModel] = {}
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+        self._refreshing: threading.Thread | None = None
+        self._subscribers: list[tuple[ModelsCallback, ErrorCallback | None]] = []
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    @property
+    def stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def subscribe(self, on_change: ModelsCallback, on_error: ErrorCallback = None) -> None:
+        with self._lock:
+            self._subscribers.append((on_change, on_error))
+
+    def models(self, block: bool = False) -> list[SDModel]:
+        """Cached models, refreshed in the background (or right away with `block`) when stale"""
+        if self.stale:
+            if block and self._loaded_at is None:
+                self.refresh()
+            else:
+                self.refresh(block=False)
+        return list(self._models)
+
+    def names(self) -> list[str]:
+        return [m.model_name for m in self._models]
+
+    def get(self, name: str) -> SDModel | None:
+        """Looks a model up by title, name, short hash or sha256"""
+        return self._index.get(name)
+
+    def refresh(self, block: bool = True) -> list[SDModel] | None:
+        if not block:
+            with self._lock:
+                if self._refreshing is None or not self._refreshing.is_alive():
+                    self._refreshing = threading.Thread(target=self._refresh_quietly, name="sd-models", daemon=True)
+                    self._refreshing.start()
+            return None
+
+        models = []
+        seen = set()
+        for m in self.client.list_models():
+            model = SDModel(
+                title=m["title"],
+                model_name=m["model_name"],
+                hash=m.get("hash"),
+                sha256=m.get("sha256"),
+                filename=m.get("filename")
+            )
+            if model.title not in seen:
+                seen.add(model.title)
+                models.append(model)
+
+        index = {}
+        # least specific first, so a model's own title or name always wins a collision
+        for attr in ("sha256", "hash", "model_name", "title"):
+            for model in models:
+                key = getattr(model, attr)
+                if key:
+                    index[key] = model
+
+        with self._lock:
+            changed = models != self._models
+            self._models = models
+            self._index = index
+            self._loaded_at = time.monotonic()
+            self.last_error = None
+            subscribers = list(self._subscribers)
+
+        if changed:
+            for on_change, _ in subscribers:
+                on_change(list(models))
+        return list(models)
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError, KeyError) as e:
+            self.last_error = e
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for _, on_error in subscribers:
+                if on_error is not None:
+                    on_error(e)
@@ -0,0 +1,235 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from PIL import Image
+from .client import SDClient
+from .scheduler import BackendScheduler
+from .tiling import tiled_img2img
+from .pipeline import plan_passes, progressive_upscale
+from .cache import ResultCache
+from .codec import CodecPool
+from .presets import PRESETS
+from .metrics import MetricsRecorder, JSONLinesExporter, combine_hooks
+from .types import EndPoints, EncodeOptions
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+
+def glob_root(pattern: str) -> str:
+    """The leading directories of a glob pattern that contain no wildcards"""
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.escape(part) != part:
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+def find_inputs(patterns: list[str], recursive: bool = False) -> list[tuple[str, str]]:
+    """Expands directories and globs into sorted (path, path relative to its input root) pairs"""
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = pattern
+            walker = os.walk(pattern) if recursive else [(pattern, [], os.listdir(pattern))]
+            for dirpath, _, filenames in walker:
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                        found[path] = os.path.relpath(path, root)
+        else:
+            # relative to the fixed part of the pattern, so scans/**/0001.png keeps the folder it was in
+            root = glob_root(pattern)
+            for path in glob.glob(pattern, recursive=recursive):
+                if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                    found[path] = os.path.relpath(path, root)
+    return sorted(found.items(), key=lambda item: item[1])
+
+
+def output_path(output_dir: str, relative: str) -> str:
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + ".png")
+
+
+def save_atomic(img: Image.Image, path: str) -> None:
+    """Writes next to the target and renames, so an interrupted run never leaves a half written output"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".partial"
+    img.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="restore-batch",
+        description="Runs img2img over every image in a directory or glob, skipping outputs that already exist."
+    )
+    parser.add_argument("inputs", nargs="+", help="input directories, files or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into subdirectories")
+    parser.add_argument("--preset", choices=list(PRESETS), default="Restoration")
+    parser.add_argument("--prompt", help="overrides the preset prompt")
+    parser.add_argument("--negative-prompt", help="overrides the preset negative prompt")
+    parser.add_argument("--denoise", type=float, help="denoising strength from 0 to 1, overrides the preset")
+    parser.add_argument("--steps", type=int, help="overrides the preset steps")
+    parser.add_argument("--cfg-scale", type=float, help="overrides the preset cfg scale")
+    parser.add_argument("--model", help="checkpoint to use, defaults to whatever the backend has loaded")
+    parser.add_argument("--seed", type=int, default=-1)
+    parser.add_argument("--restore-faces", action="store_true")
+    parser.add_argument("--scale", type=float, default=1.0, help="output size relative to the input")
+    parser.add_argument("--tile", type=int, default=0, help="process in tiles of this size, 0 sends the whole image")
+    parser.add_argument("--overlap", type=int, default=64, help="pixels neighbouring tiles share, blended to hide the seams")
+    parser.add_argument("--passes", type=int, default=1, help="reach --scale in this many img2img passes instead of one")
+    parser.add_argument("-j", "--workers", type=int, default=2, help="concurrent requests")
+    parser.add_argument("--backend", action="append", help="webui base url, repeat to load balance across several")
+    parser.add_argument("--deadline", type=float, help="give up on a request (one per image, or per tile) after this many seconds")
+    parser.add_argument(
+        "--hedge", type=float, metavar="PERCENTILE",
+        help="with several backends, resend calls slower than this latency percentile to another one"
+    )
+    parser.add_argument("--overwrite", action="store_true", help="regenerate outputs that already exist")
+    parser.add_argument(
+        "--encode", choices=["original", "png", "webp"], default="original",
+        help="how init images are uploaded, 'original' sends the input file bytes as they are"
+    )
+    parser.add_argument(
+        "--codec-workers", type=int, default=0,
+        help="encode and decode images in this many worker processes, 0 does it in the request threads"
+    )
+    parser.add_argument("--cache", help="directory to cache fixed-seed results in")
+    parser.add_argument("--cache-size", type=float, default=2.0, help="cache size limit in GB")
+    parser.add_argument("--metrics", help="append per-call stage timings to this file as JSON lines")
+    parser.add_argument("--prometheus", help="write aggregated timings here in Prometheus text format when done")
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.passes < 1:
+        parser.error("--passes must be at least 1")
+    if args.codec_workers < 0:
+        parser.error("--codec-workers can't be negative")
+    if args.tile < 0:
+        parser.error("--tile can't be negative")
+    if args.overlap < 0:
+        parser.error("--overlap can't be negative")
+    if args.tile and args.tile <= args.overlap:
+        parser.error("--tile must be larger than --overlap")
+    if args.passes > 1 and args.tile:
+        parser.error("--passes can't be combined with --tile")
+    preset = PRESETS[args.preset]
+
+    inputs = find_inputs(args.inputs, args.recursive)
+    targets = {}
+    for path, relative in inputs:
+        target = output_path(args.output, relative)
+        if target in targets:
+            parser.error(f"{targets[target]} and {path} would both be written to {target}")
+        targets[target] = path
+
+    options = {
+        "negative_prompt": args.negative_prompt if args.negative_prompt is not None else preset.negative_prompt,
+        "model_name": args.model,
+        "steps": args.steps or preset.steps,
+        "cfg_scale": args.cfg_scale if args.cfg_scale is not None else preset.cfg_scale,
+        "denoising_strength": args.denoise if args.denoise is not None else preset.denoising_strength,
+        "restore_faces": args.restore_faces,
+        "seed": args.seed,
+        "deadline": args.deadline,
+    }
+    prompt = args.prompt if args.prompt is not None else preset.prompt
+
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, max_bytes=int(args.cache_size * 1024 ** 3))
+
+    encode_options = EncodeOptions(
+        format="WEBP" if args.encode == "webp" else "PNG",
+        passthrough=args.encode == "original"
+    )
+
+    codec = CodecPool(args.codec_workers) if args.codec_workers > 0 else None
+
+    recorder = MetricsRecorder() if args.prometheus else None
+    exporter = JSONLinesExporter(args.metrics) if args.metrics else None
+    hooks = [hook for hook in (recorder, exporter) if hook is not None]
+    on_metrics = combine_hooks(*hooks) if hooks else None
+
+    backends = args.backend or [EndPoints.BASE]
+    if len(backends) > 1:
+        client = BackendScheduler(
+            [SDClient(url, cache=cache, encode_options=encode_options, on_metrics=on_metrics, codec=codec) for url in backends],
+            hedge_percentile=args.hedge
+        )
+        client.start()
+    else:
+        client = SDClient(
+            backends[0], pool_size=args.workers, cache=cache, encode_options=encode_options, on_metrics=on_metrics, codec=codec
+        )
+
+    jobs = []
+    for target, path in targets.items():
+        if args.overwrite or not os.path.exists(target):
+            jobs.append((path, target))
+    skipped = len(inputs) - len(jobs)
+    print(f"{len(inputs)} images, {skipped} already done, {len(jobs)} to process")
+
+    def process(path: str, target: str) -> float:
+        start = time.perf_counter()
+        with Image.open(path) as img:
+            width = round(img.width * args.scale)
+            height = round(img.height * args.scale)
+            if args.tile:
+                result = tiled_img2img(img, prompt, width=width, height=height, tile_size=args.tile, overlap=args.overlap, client=client, **options)
+            elif args.passes > 1:
+                passes = plan_passes(args.scale, args.passes, options["denoising_strength"], options["steps"])
+                result = progressive_upscale(img, prompt, passes, client=client, width=width, height=height, **options)[0]
+            else:
+                result = client.img2img(img, prompt, width=width, height=height, batch_size=1, **options)[0]
+        save_atomic(result, target)
+        return time.perf_counter() - start
+
+    failed = 0
+    done = 0
+
+    def report(path: str, future: Future) -> None:
+        nonlocal failed, done
+        done += 1
+        try:
+            took = future.result()
+            print(f"[{done}/{len(jobs)}] {path} ({took:.1f}s)")
+        except Exception as e:
+            failed += 1
+            print(f"[{done}/{len(jobs)}] {path} failed: {e}", file=sys.stderr)
+
+    # submit lazily so tens of thousands of inputs don't all sit in the executor queue
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            pending = deque()
+            for path, target in jobs:
+                pending.append((path, executor.submit(process, path, target)))
+                if len(pending) >= args.workers * 2:
+                    report(*pending.popleft())
+            while pending:
+                report(*pending.popleft())
+    except KeyboardInterrupt:
+        print("Interrupted, rerun the same command to resume", file=sys.stderr)
+        return 130
+    finally:
+        client.close()
+        if codec is not None:
+            codec.close()
+        if exporter is not None:
+            exporter.close()
+        if recorder is not None:
+            with open(args.prometheus, "w") as f:
+                f.write(recorder.prometheus_text())
+
+    print(f"Finished {done - failed} images, {failed} failed")
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses")
+    return 1 if failed else 0
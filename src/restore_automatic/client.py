@@ -0,0 +1,453 @@
+import base64
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+import requests
+from requests.adapters import HTTPAdapter
+from PIL.Image import Image
+from .types import EndPoints, Routes, EncodeOptions, EncodedImage
+from .utils import encode_image, bytes_to_pillowimg
+from .cache import ResultCache
+from .streaming import iter_base64_images
+from .metrics import CallMetrics, MetricsHook, server_time
+from .request import GenerationRequest, JSONBody
+
+if TYPE_CHECKING:
+    from .codec import CodecPool
+
+# turns the bytes of one result image into whatever the caller works with
+ImageDecoder = Callable[[bytes], Any]
+
+# (connect, read) in seconds, generations can legitimately take minutes
+DEFAULT_TIMEOUT = (5.0, 600.0)
+# progress, options and model calls should answer quickly even on a busy backend
+DEFAULT_SHORT_TIMEOUT = (5.0, 30.0)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """A generation did not finish within the deadline it was given"""
+
+
+def deadline_at(deadline: float | None) -> float | None:
+    """Turns a budget in seconds into an absolute `time.monotonic()` deadline"""
+    return None if deadline is None else time.monotonic() + deadline
+
+
+def build_progress_payload(id_task: str = None, id_live_preview: int = -1, live_preview: bool = False) -> dict:
+    payload = {
+        "skip_current_image": "false",
+        "skip_current_text": "true"
+    }
+    # /internal/progress only reports on the task it is asked about
+    if id_task is not None:
+        payload["id_task"] = id_task
+        payload["id_live_preview"] = id_live_preview
+        payload["live_preview"] = live_preview
+    return payload
+
+
+def decode_images(jsn: dict) -> list[Image]:
+    return [bytes_to_pillowimg(b) for b in response_image_bytes(jsn)]
+
+
+def response_image_bytes(jsn: dict) -> list[bytes]:
+    return [base64.b64decode(im) for im in jsn["images"]]
+
+
+class _ClientCore:
+    """
+    What `SDClient` and `AsyncSDClient` share besides the transport: encoding options and the
+    codec pool, the result cache and metrics reporting. The CPU heavy steps are separate from
+    the bookkeeping so the async client can run them off its event loop.
+    """
+
+    def __init__(
+            self,
+            base_url: str,
+            cache: ResultCache = None,
+            encode_options: EncodeOptions = None,
+            on_encode: Callable[[EncodedImage], None] = None,
+            image_decoder: ImageDecoder = None,
+            on_metrics: MetricsHook = None,
+            codec: "CodecPool" = None
+        ):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.encode_options = encode_options or EncodeOptions()
+        self.on_encode = on_encode
+        # with a codec pool, images are encoded and (unless a decoder is given) decoded in its worker processes
+        self.codec = codec
+        self.image_decoder = image_decoder or (codec.decode if codec is not None else bytes_to_pillowimg)
+        # called with a `CallMetrics` after every generation, see metrics.py
+        self.on_metrics = on_metrics
+        # (checkpoint, CLIP skip) last switched to with `set_model`, results are cached per model
+        self.loaded_model: tuple[str, int | None] | None = None
+
+    def _encode_image(self, img: str | Image) -> EncodedImage:
+        if self.codec is not None:
+            return self.codec.encode(img, self.encode_options)
+        return encode_image(img, self.encode_options)
+
+    def _encoded(self, encoded: EncodedImage, metrics: CallMetrics = None) -> EncodedImage:
+        """Reports an encoded init image or mask to `metrics` and `on_encode`"""
+        if metrics is not None:
+            metrics.encode += encoded.seconds
+            metrics.encoded_bytes += encoded.size
+        if self.on_encode is not None:
+            self.on_encode(encoded)
+        return encoded
+
+    @staticmethod
+    def _decode_all(raw: list[bytes], decoder: ImageDecoder) -> tuple[list, float]:
+        start = time.perf_counter()
+        images = [decoder(b) for b in raw]
+        return images, time.perf_counter() - start
+
+    @staticmethod
+    def _decoded(images: list, seconds: float, metrics: CallMetrics) -> list:
+        metrics.decode = seconds
+        metrics.images = len(images)
+        return images
+
+    def _report(self, metrics: CallMetrics, error: BaseException = None) -> None:
+        metrics.finish(error)
+        if self.on_metrics is not None:
+            self.on_metrics(metrics)
+
+    def _cache_key(self, route: str, payload: dict) -> str | None:
+        """The result cache key of a call, None when it isn't cached"""
+        if self.cache is None or not self.cache.is_cacheable(payload):
+            return None
+        return self.cache.key(route, payload, self.loaded_model)
+
+
+class SDClient(_ClientCore):
+    """
+    Reusable connection to a single webui backend.
+    Keeps a pooled keep-alive `requests.Session` so repeated generations and
+    progress polls don't pay for a new TCP connection every call.
+    """
+
+    def __init__(
+            self,
+            base_url: str = EndPoints.BASE,
+            pool_size: int = 10,
+            timeout: float | tuple[float, float] = DEFAULT_TIMEOUT,
+            short_timeout: float | tuple[float, float] = DEFAULT_SHORT_TIMEOUT,
+            max_retries: int = 0,
+            cache: ResultCache = None,
+            encode_options: EncodeOptions = None,
+            on_encode: Callable[[EncodedImage], None] = None,
+            image_decoder: ImageDecoder = None,
+            on_metrics: MetricsHook = None,
+            codec: "CodecPool" = None
+        ):
+        super().__init__(base_url, cache, encode_options, on_encode, image_decoder, on_metrics, codec)
+        self.timeout = timeout
+        self.short_timeout = short_timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({"accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=max_retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __repr__(self) -> str:
+        return f"SDClient({self.base_url!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def url(self, route: str) -> str:
+        return self.base_url + route
+
+    def post(self, route: str, payload: dict = None, timeout=None) -> requests.Response:
+        return self.session.post(
+            url=self.url(route),
+            json=payload,
+            timeout=self.timeout if timeout is None else timeout
+        )
+
+    def get(self, route: str, timeout=None) -> requests.Response:
+        return self.session.get(
+            url=self.url(route),
+            timeout=self.short_timeout if timeout is None else timeout
+        )
+
+    def _send(self, route: str, payload: dict, metrics: CallMetrics, due: float = None) -> tuple[requests.Response, float]:
+        """
+        Posts a generation with the body streamed back, filling in everything up to the response headers.
+        `due` is the absolute `time.monotonic()` deadline of the call.
+        """
+        timeout = self.timeout
+        bounded = False
+        if due is not None:
+            remaining = due - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Deadline passed before {route} was sent")
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            bounded = remaining < read
+            timeout = (min(connect, remaining), min(read, remaining))
+
+        start = time.perf_counter()
+        body = JSONBody(payload)
+        sent = time.perf_counter()
+        metrics.serialize = sent - start
+        metrics.request_bytes = len(body)
+
+        try:
+            response = self.session.post(
+                url=self.url(route),
+                data=body,
+                headers={"Content-Type": "application/json"},
+                timeout=timeout,
+                stream=True
+            )
+        except requests.Timeout as e:
+            if bounded:
+                raise DeadlineExceeded(f"{route} got no response before its deadline") from e
+            raise
+        headers_at = time.perf_counter()
+        metrics.status = response.status_code
+        metrics.server = server_time(response.headers)
+        metrics.upload = max(0.0, headers_at - sent - (metrics.server or 0.0))
+        return response, headers_at
+
+    def generate(self, route: str, payload: dict, metrics: CallMetrics = None, due: float = None) -> dict:
+        metrics = metrics or CallMetrics(route, self.base_url)
+        response, headers_at = self._send(route, payload, metrics, due)
+        with response:
+            response.raise_for_status()
+            content = b"".join(self._read_body(response, 1 << 16, metrics, due))
+            parse_start = time.perf_counter()
+            metrics.download = parse_start - headers_at
+            jsn = json.loads(content)
+            metrics.parse = time.perf_counter() - parse_start
+        return jsn
+
+    @staticmethod
+    def _read_body(response: requests.Response, chunk_size: int, metrics: CallMetrics, due: float = None) -> Iterator[bytes]:
+        for chunk in response.iter_content(chunk_size):
+            metrics.response_bytes += len(chunk)
+            if due is not None and time.monotonic() > due:
+                raise DeadlineExceeded(f"{response.url} was still downloading at its deadline")
+            yield chunk
+
+    def interrupt_task(self, task_id: str) -> bool:
+        """Interrupts the backend only if it is working on `task_id` right now"""
+        progress = self.get_progress(task_id)
+        if progress.get("active"):
+            return self.interrupt()
+        return False
+
+    def _abandon(self, payload: dict) -> None:
+        """Stops a generation nobody waits for anymore, when it was sent with a task id to check against"""
+        task_id = payload.get("force_task_id")
+        if task_id is None:
+            return
+
+        def interrupt():
+            try:
+                self.interrupt_task(task_id)
+            except (requests.RequestException, ValueError):
+                pass
+        threading.Thread(target=interrupt, name="sd-abandon", daemon=True).start()
+
+    def encode(self, img: str | Image | EncodedImage, metrics: CallMetrics = None) -> EncodedImage:
+        """Encodes an init image or mask with this client's options, reporting the cost to `on_encode`"""
+        if isinstance(img, EncodedImage):
+            return img
+        return self._encoded(self._encode_image(img), metrics)
+
+    def _decode(self, raw: list[bytes], decoder: ImageDecoder, metrics: CallMetrics) -> list:
+        return self._decoded(*self._decode_all(raw, decoder), metrics)
+
+    def generate_images(self, route: str, payload: dict, decoder: ImageDecoder = None, metrics: CallMetrics = None, due: float = None) -> list:
+        """
+        Runs a generation and decodes the result with `decoder` (the client's `image_decoder`
+        by default), going through the result cache when one is set.
+        Past `due`, an absolute `time.monotonic()` deadline, `DeadlineExceeded` is raised and
+        the generation is interrupted on the backend if it was sent with a task id.
+        """
+        decoder = decoder or self.image_decoder
+        metrics = metrics or CallMetrics(route, self.base_url)
+        try:
+            key = self._cache_key(route, payload)
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    metrics.cached = True
+                    images = self._decode(cached, decoder, metrics)
+                    self._report(metrics)
+                    return images
+
+            raw = response_image_bytes(self.generate(route, payload, metrics, due))
+            if key is not None:
+                self.cache.put(key, raw)
+            images = self._decode(raw, decoder, metrics)
+        except DeadlineExceeded as e:
+            self._abandon(payload)
+            self._report(metrics, e)
+            raise
+        except Exception as e:
+            self._report(metrics, e)
+            raise
+        self._report(metrics)
+        return images
+
+    def iter_generate(self, route: str, payload: dict, chunk_size: int = 1 << 16, metrics: CallMetrics = None, due: float = None) -> Iterator[bytes]:
+        """
+        Streams a generation and yields each encoded image as soon as it has been read,
+        so only one image of a large batch is ever held in memory.
+        Parsing happens while the body downloads, so `metrics.download` includes it.
+        """
+        metrics = metrics or CallMetrics(route, self.base_url)
+        metrics.streamed = True
+        key = self._cache_key(route, payload)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                metrics.cached = True
+                yield from cached
+                return
+
+        response, headers_at = self._send(route, payload, metrics, due)
+        with response:
+            response.raise_for_status()
+            raw = []
+            # time the consumer spends on a yielded image is not download time
+            paused = 0.0
+            for image_bytes in iter_base64_images(self._read_body(response, chunk_size, metrics, due)):
+                if key is not None:
+                    raw.append(image_bytes)
+                yielded = time.perf_counter()
+                yield image_bytes
+                paused += time.perf_counter() - yielded
+            metrics.download = time.perf_counter() - headers_at - paused
+
+        if key is not None:
+            self.cache.put(key, raw)
+
+    def _iter_images(self, route: str, payload: dict, decoder: ImageDecoder, metrics: CallMetrics, due: float = None) -> Iterator:
+        decoder = decoder or self.image_decoder
+        error = None
+        try:
+            for image_bytes in self.iter_generate(route, payload, metrics=metrics, due=due):
+                start = time.perf_counter()
+                image = decoder(image_bytes)
+                metrics.decode += time.perf_counter() - start
+                metrics.images += 1
+                yield image
+        except DeadlineExceeded as e:
+            self._abandon(payload)
+            error = e
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._report(metrics, error)
+
+    def send(self, request: GenerationRequest, decoder: ImageDecoder = None, deadline: float = None) -> list:
+        """Runs a prepared `GenerationRequest` on its route"""
+        due = deadline_at(deadline)
+        return self.generate_images(request.route, request.payload(), decoder, CallMetrics(request.route, self.base_url), due)
+
+    def img2img(self, base_img: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> list:
+        """`deadline` is the number of seconds the whole call may take, including the upload"""
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        payload = GenerationRequest(prompt, init_image=self.encode(base_img, metrics), **kwargs).payload()
+        return self.generate_images(Routes.IMG2IMG, payload, decoder, metrics, due)
+
+    def txt2img(self, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> list:
+        due = deadline_at(deadline)
+        payload = GenerationRequest(prompt, **kwargs).payload()
+        return self.generate_images(Routes.TXT2IMG, payload, decoder, due=due)
+
+    def inpaint(self, base_img_path: str | Image | EncodedImage, mask_path: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> list:
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        payload = GenerationRequest(prompt, init_image=self.encode(base_img_path, metrics), mask=self.encode(mask_path, metrics), **kwargs).payload()
+        return self.generate_images(Routes.IMG2IMG, payload, decoder, metrics, due)
+
+    def iter_img2img(self, base_img: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> Iterator:
+        """Like `img2img` but yields the images one at a time while the response is still downloading"""
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        payload = GenerationRequest(prompt, init_image=self.encode(base_img, metrics), **kwargs).payload()
+        return self._iter_images(Routes.IMG2IMG, payload, decoder, metrics, due)
+
+    def iter_txt2img(self, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> Iterator:
+        """Like `txt2img` but yields the images one at a time while the response is still downloading"""
+        due = deadline_at(deadline)
+        payload = GenerationRequest(prompt, **kwargs).payload()
+        return self._iter_images(Routes.TXT2IMG, payload, decoder, CallMetrics(Routes.TXT2IMG, self.base_url), due)
+
+    def iter_inpaint(self, base_img_path: str | Image | EncodedImage, mask_path: str | Image | EncodedImage, prompt: str, decoder: ImageDecoder = None, deadline: float = None, **kwargs) -> Iterator:
+        due = deadline_at(deadline)
+        metrics = CallMetrics(Routes.IMG2IMG, self.base_url)
+        payload = GenerationRequest(prompt, init_image=self.encode(base_img_path, metrics), mask=self.encode(mask_path, metrics), **kwargs).payload()
+        return self._iter_images(Routes.IMG2IMG, payload, decoder, metrics, due)
+
+    def set_model(self, model_name: str, CLIP_stop_at_last_layers: int = None) -> None:
+        modeldata = {
+            "sd_model_checkpoint": model_name,
+            "show_progress_every_n_steps": int('1')
+        }
+        if CLIP_stop_at_last_layers is not None:
+            modeldata["CLIP_stop_at_last_layers"] = CLIP_stop_at_last_layers
+        # loading a checkpoint can take a while, so this uses the long timeout
+        paramresponse = self.post(Routes.OPTIONS, modeldata)
+        if paramresponse.status_code != 200:
+            raise Exception("Could not set model. Error: " + paramresponse.text)
+        self.loaded_model = (model_name, CLIP_stop_at_last_layers)
+
+    def get_progress(self, id_task: str = None, id_live_preview: int = -1, live_preview: bool = False) -> dict:
+        payload = build_progress_payload(id_task, id_live_preview, live_preview)
+        response = self.post(Routes.PROGRESS, payload, timeout=self.short_timeout)
+        return response.json()
+
+    def get_state(self) -> dict:
+        """
+        The server wide progress, `state.job` and `state.job_count` say whether anything is
+        running. `/internal/progress` can't tell, without a task id it reports an idle webui as active.
+        """
+        response = self.get(Routes.STATE)
+        response.raise_for_status()
+        return response.json()
+
+    def list_models(self) -> list:
+        model_resp = self.get(Routes.MODELS)
+        return model_resp.json()
+
+    def interrupt(self) -> bool:
+        resp = self.post(Routes.INTERRUPT, timeout=self.short_timeout)
+        return resp.status_code == 200
+
+
+_default_client: SDClient | None = None
+_default_client_lock = threading.Lock()
+
+def get_default_client() -> SDClient:
+    """Returns the shared client used by the module level `sd_*` functions"""
+    global _default_client
+    if _default_client is None:
+        # threads that race here would otherwise each build a client and pool, and all but one would leak
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = SDClient()
+    return _default_client
+
+def set_default_client(client: SDClient) -> None:
+    """Points the module level `sd_*` functions at another backend or pool configuration"""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
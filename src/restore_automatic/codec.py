@@ -0,0 +1,154 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import replace
+from typing import Callable
+from multiprocessing.shared_memory import SharedMemory
+from PIL import Image
+from .types import EncodeOptions, EncodedImage
+from .utils import encode_image
+
+# bytes per pixel of the modes that go through shared memory as they are, others become RGBA
+_PIXEL_MODES = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4}
+
+
+def _shared_mode(img: Image.Image) -> str:
+    return img.mode if img.mode in _PIXEL_MODES else "RGBA"
+
+
+def _pixel_size(mode: str, size: tuple[int, int]) -> int:
+    return _PIXEL_MODES[mode] * size[0] * size[1]
+
+
+def _encode_shared(name: str, mode: str, size: tuple[int, int], options: EncodeOptions) -> EncodedImage:
+    shm = SharedMemory(name)
+    try:
+        img = Image.frombuffer(mode, size, shm.buf[:_pixel_size(mode, size)], "raw", mode, 0, 1)
+        encoded = encode_image(img, options)
+        del img
+        return encoded
+    finally:
+        shm.close()
+
+
+def _encode_path(path: str, options: EncodeOptions) -> EncodedImage:
+    return encode_image(path, options)
+
+
+def _decode_shared(image_bytes: bytes, name: str, mode: str) -> None:
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.mode != mode:
+        img = img.convert(mode)
+    shm = SharedMemory(name)
+    try:
+        shm.buf[:_pixel_size(mode, img.size)] = img.tobytes()
+    finally:
+        shm.close()
+
+
+def _release(shm: SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+
+def _chain(worker: Future, finish: Callable, shm: SharedMemory = None) -> Future:
+    """
+    A future of `finish(worker result)`. `finish` runs when the worker is done, on the pool's
+    management thread, and the shared memory is released right after.
+    """
+    future = Future()
+
+    def done(worker: Future) -> None:
+        try:
+            result = finish(worker.result())
+        except BaseException as e:
+            # an awaiting task that was cancelled has cancelled the future already
+            if not future.cancelled():
+                future.set_exception(e)
+        else:
+            if not future.cancelled():
+                future.set_result(result)
+        finally:
+            if shm is not None:
+                _release(shm)
+
+    worker.add_done_callback(done)
+    return future
+
+
+class CodecPool:
+    """
+    Runs image encoding and decoding in worker processes, so a client serving many
+    concurrent generations isn't held to one core by the GIL. Pixels go to and from the
+    workers through shared memory, only the much smaller compressed images are pickled.
+    `encode` fits `SDClient(codec=...)` and `decode` is an `ImageDecoder`, `submit_encode` and
+    `submit_decode` return futures instead of blocking. Share one pool between clients, it is
+    not closed with them.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        # spawn, forking a process that has http and Qt threads running isn't safe
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def __repr__(self) -> str:
+        return f"CodecPool(workers={self.workers})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def submit_encode(self, img: str | Image.Image, options: EncodeOptions = None) -> Future:
+        """
+        Starts encoding `img` and returns a future of the `EncodedImage`, for callers that
+        wait on it some other way, e.g. `asyncio.wrap_future`
+        """
+        options = options or EncodeOptions()
+        start = time.perf_counter()
+        if type(img) != str and options.passthrough:
+            filename = getattr(img, "filename", "")
+            if filename and os.path.isfile(filename):
+                img = filename
+        if type(img) == str:
+            return _chain(self.executor.submit(_encode_path, img, options), lambda encoded: replace(encoded, seconds=time.perf_counter() - start))
+
+        mode = _shared_mode(img)
+        if img.mode != mode:
+            img = img.convert(mode)
+        shm = SharedMemory(create=True, size=max(1, _pixel_size(mode, img.size)))
+        try:
+            shm.buf[:_pixel_size(mode, img.size)] = img.tobytes()
+            worker = self.executor.submit(_encode_shared, shm.name, mode, img.size, options)
+        except BaseException:
+            _release(shm)
+            raise
+        return _chain(worker, lambda encoded: replace(encoded, seconds=time.perf_counter() - start), shm)
+
+    def submit_decode(self, image_bytes: bytes) -> Future:
+        """Starts decoding `image_bytes` and returns a future of the loaded pillow image"""
+        # opening only reads the header, which is all that's needed to size the buffer
+        with Image.open(io.BytesIO(image_bytes)) as header:
+            mode = _shared_mode(header)
+            size = header.size
+        shm = SharedMemory(create=True, size=max(1, _pixel_size(mode, size)))
+        try:
+            worker = self.executor.submit(_decode_shared, image_bytes, shm.name, mode)
+        except BaseException:
+            _release(shm)
+            raise
+        return _chain(worker, lambda _: Image.frombytes(mode, size, shm.buf[:_pixel_size(mode, size)]), shm)
+
+    def encode(self, img: str | Image.Image, options: EncodeOptions = None) -> EncodedImage:
+        """Like `encode_image`, `seconds` includes the time spent handing the image over"""
+        return self.submit_encode(img, options).result()
+
+    def decode(self, image_bytes: bytes) -> Image.Image:
+        """Decodes an encoded image into a loaded pillow image"""
+        return self.submit_decode(image_bytes).result()
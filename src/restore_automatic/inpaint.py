@@ -0,0 +1,88 @@
+import math
+from PIL import Image, ImageFilter
+from .client import SDClient, get_default_client
+from .utils import bytes_to_pillowimg
+
+
+def _round8(v: float) -> int:
+    return max(8, round(v / 8) * 8)
+
+
+def mask_bounds(mask: Image.Image, padding: int = 32) -> tuple[int, int, int, int] | None:
+    """Box around everything the mask marks for inpainting plus `padding`, None for an empty mask"""
+    box = mask.convert("L").point(lambda v: 255 if v > 0 else 0).getbbox()
+    if box is None:
+        return None
+    left, top, right, bottom = box
+    return (
+        max(0, left - padding), max(0, top - padding),
+        min(mask.width, right + padding), min(mask.height, bottom + padding)
+    )
+
+
+def crop_resolution(width: int, height: int, resolution: int = 512) -> tuple[int, int]:
+    """Generation size with about `resolution`² pixels and the crop's aspect ratio"""
+    factor = math.sqrt(resolution * resolution / (width * height))
+    return _round8(width * factor), _round8(height * factor)
+
+
+def feathered_mask(mask: Image.Image, feather: int) -> Image.Image:
+    """
+    Grows the mask by `feather` and softens its edge over the same distance, so everything
+    that was masked is fully replaced and the transition happens in the padding around it.
+    """
+    if feather <= 0:
+        return mask
+    grown = mask.filter(ImageFilter.GaussianBlur(feather / 2)).point(lambda v: 255 if v > 0 else 0)
+    return grown.filter(ImageFilter.GaussianBlur(feather / 2))
+
+
+def bounded_inpaint(
+        base_img: str | Image.Image,
+        mask: str | Image.Image,
+        prompt: str,
+        padding: int = 32,
+        resolution: int = 512,
+        feather: int = 8,
+        client: SDClient = None,
+        **kwargs
+    ) -> list[Image.Image]:
+    """
+    Inpaints only the part of the image the mask covers. The mask's bounding box plus
+    `padding` is cropped out, generated at about `resolution`² pixels and pasted back with
+    a `feather` wide soft edge, so a small touch-up on a huge scan costs a small generation.
+    Returns one full size image per generated result. White in the mask is repainted.
+    `client` can be an `SDClient` or a `BackendScheduler`.
+    """
+    if type(base_img) == str:
+        base_img = Image.open(base_img)
+    if type(mask) == str:
+        mask = Image.open(mask)
+    client = client or get_default_client()
+
+    mask = mask.convert("L")
+    if mask.size != base_img.size:
+        mask = mask.resize(base_img.size, Image.Resampling.NEAREST)
+    box = mask_bounds(mask, padding)
+    if box is None:
+        raise ValueError("The mask is empty, there is nothing to inpaint")
+
+    source = base_img.convert("RGB")
+    crop = source.crop(box)
+    crop_mask = mask.crop(box)
+    width, height = crop_resolution(*crop.size, resolution)
+    kwargs.pop("width", None)
+    kwargs.pop("height", None)
+
+    results = client.inpaint(crop, crop_mask, prompt, decoder=bytes_to_pillowimg, width=width, height=height, **kwargs)
+
+    blend = feathered_mask(crop_mask, feather)
+    images = []
+    for result in results:
+        result = result.convert("RGB")
+        if result.size != crop.size:
+            result = result.resize(crop.size, Image.Resampling.LANCZOS)
+        output = source.copy()
+        output.paste(result, box[:2], blend)
+        images.append(output)
+    return images
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import itertools
+import threading
+from typing import TYPE_CHECKING, Callable, Literal
+from PySide6.QtWidgets import QListWidget, QListWidgetItem, QAbstractItemView, QMenu, QWidget
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QKeyEvent, QImage
+from .types import SDProgress
+
+if TYPE_CHECKING:
+    from .client import SDClient
+
+GenTypes = Literal["img2img"] | Literal["txt2img"] | Literal["inpaint"] | Literal["upscale"]
+JobStatus = Literal["queued"] | Literal["running"] | Literal["done"] | Literal["failed"] | Literal["cancelled"]
+
+_job_ids = itertools.count(1)
+
+
+class GenerationJob:
+    def __init__(self, gen_type: GenTypes, kwargs: dict):
+        self.id = next(_job_ids)
+        self.gen_type = gen_type
+        self.kwargs = kwargs
+        self.task_id: str | None = kwargs.get("task_id")
+        self.status: JobStatus = "queued"
+        self.progress = 0.0
+        self.cancel_requested = False
+        self.result: list | None = None
+        self.error: Exception | None = None
+
+    def __repr__(self) -> str:
+        return f"GenerationJob(#{self.id}, {self.gen_type}, {self.status})"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def describe(self) -> str:
+        text = f"#{self.id} {self.gen_type} - {self.status}"
+        if self.status == "running" and self.progress > 0:
+            text += f" {self.progress * 100:.0f}%"
+        if self.cancel_requested and not self.finished:
+            text += " (cancelling)"
+        return text
+
+
+def run_generation(client: SDClient, gen_type: GenTypes, kwargs: dict, should_stop: Callable[[], bool] = None) -> list[QImage]:
+    """Runs one job on the calling (worker) thread, QImages go in and come back out without pillow"""
+    # requests, pillow and the pipelines stay off the GUI's startup path until a job runs
+    from .qt_image import encode_qimage, qimage_from_bytes, qimage_to_pil, pil_to_qimage
+    from .pipeline import progressive_upscale
+    from .inpaint import bounded_inpaint
+
+    kwargs = dict(kwargs)
+    if gen_type == "inpaint":
+        # the crop is pasted back with pillow, so this one goes through pillow images
+        for item in ("base_img", "mask_path"):
+            if isinstance(kwargs.get(item), QImage):
+                kwargs[item] = qimage_to_pil(kwargs[item])
+        base_img, mask = kwargs.pop("base_img"), kwargs.pop("mask_path")
+        return [pil_to_qimage(img) for img in bounded_inpaint(base_img, mask, client=client, **kwargs)]
+
+    kwargs["decoder"] = qimage_from_bytes
+    if gen_type == "upscale" and isinstance(kwargs.get("base_img"), QImage):
+        kwargs["source_size"] = (kwargs["base_img"].width(), kwargs["base_img"].height())
+    for item in ("base_img", "mask_path"):
+        if isinstance(kwargs.get(item), QImage):
+            kwargs[item] = encode_qimage(kwargs[item], client.encode_options)
+    if gen_type == "txt2img":
+        for item in ("base_img", "mask_path"):
+            kwargs.pop(item, None)
+        return client.txt2img(**kwargs)
+    if gen_type == "img2img":
+        kwargs.pop("mask_path", None)
+        return client.img2img(**kwargs)
+    if gen_type == "upscale":
+        kwargs.pop("mask_path", None)
+        return progressive_upscale(client=client, should_stop=should_stop, **kwargs)
+    raise ValueError(f"Unknown generation type {gen_type}")
+
+
+class _JobSignals(QObject):
+    started = Signal(object)
+    finished = Signal(object, object, object)
+
+
+class _JobRunnable(QRunnable):
+    def __init__(self, client: SDClient, job: GenerationJob, signals: _JobSignals):
+        super().__init__()
+        self.client = client
+        self.job = job
+        self.signals = signals
+
+    def run(self):
+        if self.job.cancel_requested:
+            self.signals.finished.emit(self.job, None, None)
+            return
+        self.signals.started.emit(self.job)
+        try:
+            results = run_generation(self.client, self.job.gen_type, self.job.kwargs, lambda: self.job.cancel_requested)
+        except Exception as e:
+            self.signals.finished.emit(self.job, None, e)
+        else:
+            self.signals.finished.emit(self.job, results, None)
+
+
+class GenerationQueue(QObject):
+    """
+    Long lived pool of generation workers behind a job queue.
+    Several jobs can be outstanding at once, each can be cancelled on its own, and results
+    are handed out through `result_ready` in the order the jobs were submitted.
+    """
+
+    job_changed = Signal(GenerationJob)
+    result_ready = Signal(GenerationJob, list)
+    job_failed = Signal(GenerationJob, Exception)
+
+    def __init__(self, client: SDClient = None, workers: int = 2, parent: QObject = None):
+        super().__init__(parent)
+        self._client = client
+        self.jobs: list[GenerationJob] = []
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(workers)
+        self._signals = _JobSignals()
+        self._signals.started.connect(self._job_started)
+        self._signals.finished.connect(self._job_finished)
+
+    @property
+    def client(self) -> SDClient:
+        if self._client is None:
+            from .client import get_default_client
+            self._client = get_default_client()
+        return self._client
+
+    @property
+    def outstanding(self) -> list[GenerationJob]:
+        return [job for job in self.jobs if not job.finished]
+
+    def submit(self, gen_type: GenTypes, kwargs: dict) -> GenerationJob:
+        job = GenerationJob(gen_type, kwargs)
+        self.jobs.append(job)
+        self.pool.start(_JobRunnable(self.client, job, self._signals))
+        self.job_changed.emit(job)
+        return job
+
+    def cancel(self, job: GenerationJob) -> None:
+        """
+        Queued jobs never start. A running job is interrupted on the backend once its task is
+        the one the backend is working on, see `progress_updated`.
+        """
+        if job.finished:
+            return
+        job.cancel_requested = True
+        if job.status == "running" and job.task_id is None:
+            # without a task id there is no telling which job the backend is on
+            self._interrupt()
+        self.job_changed.emit(job)
+
+    def cancel_all(self) -> None:
+        for job in self.outstanding:
+            self.cancel(job)
+
+    def progress_updated(self, update: SDProgress) -> None:
+        for job in self.outstanding:
+            if job.task_id is None or job.task_id != update.task_id:
+                continue
+            if update.active:
+                job.progress = update.progress
+                if job.cancel_requested:
+                    self._interrupt()
+                self.job_changed.emit(job)
+
+    def _interrupt(self) -> None:
+        # interrupt can block on a busy backend, keep it off the UI thread
+        threading.Thread(target=self.client.interrupt, daemon=True).start()
+
+    def _job_started(self, job: GenerationJob) -> None:
+        job.status = "running"
+        self.job_changed.emit(job)
+
+    def _job_finished(self, job: GenerationJob, results: list | None, err: Exception | None) -> None:
+        if job.cancel_requested:
+            job.status = "cancelled"
+        elif err is not None:
+            job.status = "failed"
+            job.error = err
+        else:
+            job.status = "done"
+            job.result = results
+        self.job_changed.emit(job)
+        self._deliver()
+
+    def _deliver(self) -> None:
+        """Hands out finished jobs up to the first one that is still outstanding"""
+        while self.jobs and self.jobs[0].finished:
+            job = self.jobs.pop(0)
+            if job.status == "done":
+                self.result_ready.emit(job, job.result)
+                job.result = None
+            elif job.status == "failed":
+                self.job_failed.emit(job, job.error)
+
+
+class JobList(QListWidget):
+    """Shows every submitted job with its status, Delete or the context menu cancels one"""
+
+    def __init__(self, queue: GenerationQueue, parent: QWidget = None):
+        super().__init__(parent)
+        self.queue = queue
+        self.items: dict[int, QListWidgetItem] = {}
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setMaximumHeight(120)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.on_context_menu_requested)
+        queue.job_changed.connect(self.update_job)
+
+    def update_job(self, job: GenerationJob):
+        item = self.items.get(job.id)
+        if item is None:
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, job)
+            self.items[job.id] = item
+            self.addItem(item)
+        item.setText(job.describe())
+        if job.finished:
+            self.takeItem(self.row(item))
+            del self.items[job.id]
+
+    def selected_job(self) -> GenerationJob | None:
+        item = self.currentItem()
+        return item.data(Qt.UserRole) if item is not None else None
+
+    def keyPressEvent(self, event: QKeyEvent) -> None:
+        if event.key() == Qt.Key_Delete:
+            job = self.selected_job()
+            if job is not None:
+                self.queue.cancel(job)
+        else:
+            super().keyPressEvent(event)
+
+    def on_context_menu_requested(self, pos):
+        item = self.itemAt(pos)
+        if item is not None:
+            context_menu = QMenu(self)
+            cancel = context_menu.addAction("Cancel")
+            if context_menu.exec(self.viewport().mapToGlobal(pos)) == cancel:
+                self.queue.cancel(item.data(Qt.UserRole))
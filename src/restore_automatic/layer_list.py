@@ -1,103 +1,243 @@
-from PySide6.QtWidgets import QListWidget, QWidget, QListWidgetItem, QHBoxLayout, QLabel, QAbstractItemView, QMenuBar, QMenu
-from PySide6.QtCore import QItemSelection, Qt, Signal
-from PySide6.QtGui import QKeyEvent, QMouseEvent, QPixmap, QImage, QIcon
+from PySide6.QtWidgets import (
+    QListView, QWidget, QAbstractItemView, QMenu, QStyledItemDelegate, QStyleOptionViewItem, QStyle
+)
+from PySide6.QtCore import (
+    QAbstractListModel, QModelIndex, QObject, QRect, QRunnable, QSize,
+    QThreadPool, Qt, Signal
+)
+from PySide6.QtGui import QKeyEvent, QPainter, QPixmap, QPixmapCache, QImage, QIcon
+from .layer_store import LayerStore, THUMBNAIL_SIZE
+
+LayerRole = Qt.UserRole + 1
+
+
+class LayerItem:
+    """
+    One layer in the list. Until the background spill finishes the full image is held here,
+    afterwards it only lives in the store and is loaded on demand.
+    """
+
+    def __init__(self, name: str, image: QImage, store: LayerStore):
+        self.name = name
+        self.store = store
+        self.layer_id: int | None = None
+        self._pending: QImage | None = image
 
-class LayerItem(QWidget):
+    def __repr__(self) -> str:
+        return f"LayerItem({self.name!r}, id={self.layer_id})"
 
-    clicked = Signal(type)
+    @property
+    def ready(self) -> bool:
+        return self.layer_id is not None
+
+    @property
+    def image(self) -> QImage:
+        if self._pending is not None:
+            return self._pending
+        return self.store.image(self.layer_id)
+
+    def thumbnail(self) -> QPixmap | None:
+        """Thumbnail pixmap once the layer is stored, pixmaps are kept in Qt's shared pixmap cache"""
+        if not self.ready:
+            return None
+        key = f"restore-layer-{id(self.store)}-{self.layer_id}"
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(self.store.thumbnail(self.layer_id))
+            QPixmapCache.insert(key, pixmap)
+        return pixmap
 
-    def __init__(self, name, image: QImage):
-        super().__init__(None)
-        self.name = name
-        self.image = image
-        self.item: QListWidgetItem = None
 
-        self.lay = QHBoxLayout()
-        self.lay.setAlignment(Qt.AlignmentFlag.AlignLeft)
+class _SpillSignals(QObject):
+    finished = Signal(object, int)
 
-        self.img_lbl = QLabel()
-        img = image.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.img_lbl.setPixmap(QPixmap.fromImage(img))
-        self.lay.addWidget(self.img_lbl)
 
-        self.name_lbl = QLabel(name)
-        self.name_lbl.setStyleSheet("font-size: 16px;")
-        self.lay.addWidget(self.name_lbl)
+class _SpillRunnable(QRunnable):
+    """Writes a layer to the store and scales its thumbnail off the UI thread"""
 
-        self.setLayout(self.lay)
+    def __init__(self, layer: LayerItem, signals: _SpillSignals):
+        super().__init__()
+        self.layer = layer
+        self.signals = signals
 
-    def mousePressEvent(self, event: QMouseEvent) -> None:
-        if event.button() == Qt.LeftButton:
-            self.clicked.emit(self)  
+    def run(self):
+        layer_id = self.layer.store.add(self.layer._pending)
+        self.signals.finished.emit(self.layer, layer_id)
 
-class LayerList(QListWidget):
 
-    item_pressed = Signal(LayerItem)
-    update_current = Signal(LayerItem)
+class LayerModel(QAbstractListModel):
+    """Newest first list of layers, rows show up right away and get their thumbnail when it is ready"""
 
-    def __init__(self, parent: QWidget):
+    def __init__(self, store: LayerStore, parent: QObject = None):
         super().__init__(parent)
+        self.store = store
+        self.layers: list[LayerItem] = []
+        # one worker keeps spills in order and bounds how much disk IO runs at once
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._signals = _SpillSignals()
+        self._signals.finished.connect(self._spilled)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.layers)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        layer = self.layers[index.row()]
+        if role == Qt.DisplayRole:
+            return layer.name
+        if role == Qt.DecorationRole:
+            return layer.thumbnail()
+        if role == LayerRole:
+            return layer
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled
+
+    def add(self, name: str, image: QImage) -> QModelIndex:
+        layer = LayerItem(name, image, self.store)
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.layers.insert(0, layer)
+        self.endInsertRows()
+        self.pool.start(_SpillRunnable(layer, self._signals))
+        return self.index(0)
+
+    def layer(self, index: QModelIndex) -> LayerItem | None:
+        return self.layers[index.row()] if index.isValid() else None
+
+    def remove_rows(self, rows: list[int]) -> None:
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            layer = self.layers.pop(row)
+            self.endRemoveRows()
+            if layer.ready:
+                self.store.remove(layer.layer_id)
+
+    def close(self) -> None:
+        self.pool.waitForDone()
+        self.store.close()
+
+    def _spilled(self, layer: LayerItem, layer_id: int) -> None:
+        layer.layer_id = layer_id
+        layer._pending = None
+        try:
+            row = self.layers.index(layer)
+        except ValueError:
+            # deleted while it was being written
+            self.store.remove(layer_id)
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class LayerDelegate(QStyledItemDelegate):
+    """Paints a thumbnail with the layer name next to it, every row has the same height"""
+
+    padding = 5
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        return QSize(THUMBNAIL_SIZE * 2, THUMBNAIL_SIZE + self.padding * 2)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex) -> None:
+        style = option.widget.style() if option.widget else None
+        if style is not None:
+            style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+
+        painter.save()
+        thumb_rect = QRect(
+            option.rect.left() + self.padding, option.rect.top() + self.padding, THUMBNAIL_SIZE, THUMBNAIL_SIZE
+        )
+        pixmap: QPixmap = index.data(Qt.DecorationRole)
+        if pixmap is not None:
+            target = QRect(0, 0, pixmap.width(), pixmap.height())
+            target.moveCenter(thumb_rect.center())
+            painter.drawPixmap(target, pixmap)
+        else:
+            painter.setPen(option.palette.mid().color())
+            painter.drawRect(thumb_rect.adjusted(0, 0, -1, -1))
+
+        font = painter.font()
+        font.setPixelSize(16)
+        painter.setFont(font)
+        if option.state & QStyle.State_Selected:
+            painter.setPen(option.palette.highlightedText().color())
+        else:
+            painter.setPen(option.palette.text().color())
+        text_rect = option.rect.adjusted(THUMBNAIL_SIZE + self.padding * 3, 0, -self.padding, 0)
+        painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft, index.data(Qt.DisplayRole))
+        painter.restore()
+
+
+class LayerList(QListView):
+
+    item_pressed = Signal(object)
+    update_current = Signal(object)
+
+    def __init__(self, parent: QWidget, store: LayerStore = None):
+        super().__init__(parent)
+        self.layer_model = LayerModel(store or LayerStore(), self)
+        self.setModel(self.layer_model)
+        self.setItemDelegate(LayerDelegate(self))
+        # fixed row height lets the view skip measuring rows that are not on screen
+        self.setUniformItemSizes(True)
 
         self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
-
-        self.setItemAlignment(Qt.AlignmentFlag.AlignTop)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.pressed.connect(self.item_clicked)
 
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.on_context_menu_requested)
 
+    @property
+    def store(self) -> LayerStore:
+        return self.layer_model.store
+
+    def count(self) -> int:
+        return self.layer_model.rowCount()
+
     def add_image(self, name: str, image: QImage):
-        widget = LayerItem(name, image)
-        widget.clicked.connect(self.item_clicked)
-        item = QListWidgetItem()
-        item.setFlags(item.flags() | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled | Qt.ItemIsEnabled)
-        item.setSizeHint(widget.sizeHint())
-        widget.item = item
-        self.insertItem(0, item)
-        self.setItemWidget(item, widget)
-        self.setCurrentItem(item)
-
-    def item_clicked(self, item: LayerItem):
-        self.setCurrentItem(item.item)       
-        self.item_pressed.emit(item)
+        index = self.layer_model.add(name, image)
+        self.setCurrentIndex(index)
+
+    def item_clicked(self, index: QModelIndex):
+        layer = self.layer_model.layer(index)
+        if layer is not None:
+            self.item_pressed.emit(layer)
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
         if event.key() == Qt.Key_Delete:
             self.delete_layer()
-
-    def selectionChanged(self, selected: QItemSelection, deselected: QItemSelection) -> None:
-        return super().selectionChanged(selected, deselected)
+        else:
+            super().keyPressEvent(event)
 
     def delete_layer(self):
         # check if selected
-        if not self.selectedItems():
+        rows = [index.row() for index in self.selectionModel().selectedIndexes()]
+        if not rows:
             return
 
         # delete selected
-        for item in self.selectedItems():
-            self.takeItem(self.row(item))
+        self.layer_model.remove_rows(rows)
 
-        first_item = self.item(0)
-        if first_item:
-            widget = self.itemWidget(first_item)
-            self.setCurrentItem(widget.item)
-            self.update_current.emit(widget)
+        first = self.layer_model.index(0)
+        if first.isValid():
+            self.setCurrentIndex(first)
+            self.update_current.emit(self.layer_model.layer(first))
+
+    def close_store(self) -> None:
+        self.layer_model.close()
 
     def on_context_menu_requested(self, pos):
-        item = self.itemAt(pos)
-        
-        if item is not None:
+        index = self.indexAt(pos)
+
+        if index.isValid():
             context_menu = QMenu(self)
-            
+
             add_to_ps = context_menu.addAction("Add to Photoshop")
             add_to_ps.setIcon(QIcon.fromTheme("document-open"))
 
-            
             chosen_action = context_menu.exec(self.viewport().mapToGlobal(pos))
-            
-            # # Handle the chosen action
-            # if chosen_action == add_to_ps:
-            #     print(f"Add to Photoshop")
-            # elif chosen_action == action2:
-            #     print(f"")
-            # elif chosen_action == action3:
\ No newline at end of file
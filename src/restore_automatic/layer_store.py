@@ -0,0 +1,132 @@
+import itertools
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage
+
+THUMBNAIL_SIZE = 100
+
+
+@dataclass
+class _StoredLayer:
+    path: str
+    width: int
+    height: int
+    bytes_per_line: int
+    format: QImage.Format
+    compressed: bool
+    thumbnail: QImage
+
+
+class LayerStore:
+    """
+    Keeps full resolution layer pixels on disk and only thumbnails in memory.
+    Layers are written as raw scanlines, optionally zlib compressed, and come back either
+    memory mapped (so the OS can drop the pages again under pressure) or decompressed.
+    The `max_resident` most recently used full images are kept loaded.
+    """
+
+    def __init__(self, directory: str = None, max_resident: int = 4, compress: bool = False):
+        self._owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="restore-layers-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_resident = max_resident
+        self.compress = compress
+
+        self._ids = itertools.count(1)
+        self._layers: dict[int, _StoredLayer] = {}
+        self._resident: OrderedDict[int, QImage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._layers)
+
+    def __contains__(self, layer_id: int) -> bool:
+        return layer_id in self._layers
+
+    def add(self, image: QImage, thumbnail: QImage = None) -> int:
+        """Spills an image to disk and returns its layer id"""
+        if image.colorCount() > 0:
+            # the raw dump has no room for a color table
+            image = image.convertToFormat(QImage.Format_ARGB32)
+
+        layer_id = next(self._ids)
+        path = os.path.join(self.directory, f"{layer_id}.raw")
+        data = image.constBits()
+        with open(path, "wb") as f:
+            f.write(zlib.compress(data, 1) if self.compress else data)
+
+        if thumbnail is None:
+            thumbnail = make_thumbnail(image)
+
+        with self._lock:
+            self._layers[layer_id] = _StoredLayer(
+                path, image.width(), image.height(), image.bytesPerLine(),
+                image.format(), self.compress, thumbnail
+            )
+            self._remember(layer_id, image)
+        return layer_id
+
+    def thumbnail(self, layer_id: int) -> QImage:
+        return self._layers[layer_id].thumbnail
+
+    def size(self, layer_id: int) -> tuple[int, int]:
+        layer = self._layers[layer_id]
+        return layer.width, layer.height
+
+    def image(self, layer_id: int) -> QImage:
+        """Full resolution image of a layer, loaded from disk unless it was used recently"""
+        with self._lock:
+            image = self._resident.get(layer_id)
+            if image is not None:
+                self._resident.move_to_end(layer_id)
+                return image
+            layer = self._layers[layer_id]
+
+        image = self._load(layer)
+        with self._lock:
+            self._remember(layer_id, image)
+        return image
+
+    def remove(self, layer_id: int) -> None:
+        with self._lock:
+            layer = self._layers.pop(layer_id, None)
+            self._resident.pop(layer_id, None)
+        if layer is not None:
+            try:
+                os.remove(layer.path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._layers.clear()
+            self._resident.clear()
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _remember(self, layer_id: int, image: QImage) -> None:
+        self._resident[layer_id] = image
+        self._resident.move_to_end(layer_id)
+        while len(self._resident) > self.max_resident:
+            self._resident.popitem(last=False)
+
+    def _load(self, layer: _StoredLayer) -> QImage:
+        with open(layer.path, "rb") as f:
+            if layer.compressed:
+                data = zlib.decompress(f.read())
+            else:
+                # copy-on-write mapping, so writes to the QImage never reach the file
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        # QImage keeps a reference to `data` for as long as it lives
+        return QImage(data, layer.width, layer.height, layer.bytes_per_line, layer.format)
+
+
+def make_thumbnail(image: QImage, size: int = THUMBNAIL_SIZE) -> QImage:
+    return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
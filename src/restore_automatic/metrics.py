@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Callable, IO
+
+# client side stages of one generation call, in the order they happen
+STAGES = ("encode", "serialize", "upload", "server", "download", "parse", "decode")
+
+# seconds, from a fast decode up to a long hires generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+@dataclass
+class CallMetrics:
+    """
+    Where the time of one generation call went.
+    `upload` runs from sending the request until the response headers arrive, minus `server`,
+    so it also covers connection setup and network latency. `server` comes from the webui's
+    X-Process-Time header and stays None when the backend doesn't send it.
+    """
+    route: str
+    backend: str
+    encode: float = 0.0
+    serialize: float = 0.0
+    upload: float = 0.0
+    server: float | None = None
+    download: float = 0.0
+    parse: float = 0.0
+    decode: float = 0.0
+    total: float = 0.0
+    encoded_bytes: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    images: int = 0
+    status: int | None = None
+    cached: bool = False
+    streamed: bool = False
+    error: str | None = None
+    timestamp: float = field(default_factory=time.time)
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def outcome(self) -> str:
+        if self.error is not None:
+            return "error"
+        return "cached" if self.cached else "ok"
+
+    def finish(self, error: BaseException = None) -> "CallMetrics":
+        self.total = time.perf_counter() - self.started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        return self
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        del data["started"]
+        return data
+
+
+MetricsHook = Callable[[CallMetrics], None]
+
+
+def combine_hooks(*hooks: MetricsHook) -> MetricsHook:
+    """One `on_metrics` hook that calls several, e.g. a recorder and a JSON lines exporter"""
+    def hook(metrics: CallMetrics) -> None:
+        for h in hooks:
+            h(metrics)
+    return hook
+
+
+def server_time(headers) -> float | None:
+    value = headers.get("X-Process-Time")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRecorder:
+    """
+    Aggregates `CallMetrics` per route and backend, pass it as a client's `on_metrics` hook.
+    `prometheus_text()` renders everything in the Prometheus text exposition format.
+    """
+
+    def __init__(self, namespace: str = "restore", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._calls: dict[tuple[str, str, str], int] = {}
+        self._stages: dict[tuple[str, str, str], _Histogram] = {}
+        self._bytes: dict[tuple[str, str, str], int] = {}
+        self._images: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: CallMetrics) -> None:
+        self.record(metrics)
+
+    def record(self, metrics: CallMetrics) -> None:
+        route, backend = metrics.route, metrics.backend
+        with self._lock:
+            key = (route, backend, metrics.outcome)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            if metrics.error is not None:
+                return
+
+            for stage in STAGES + ("total",):
+                value = getattr(metrics, stage)
+                if value is None:
+                    continue
+                histogram = self._stages.get((route, backend, stage))
+                if histogram is None:
+                    histogram = self._stages[(route, backend, stage)] = _Histogram(self.buckets)
+                histogram.observe(value)
+
+            for direction, value in (("request", metrics.request_bytes), ("response", metrics.response_bytes)):
+                self._bytes[(route, backend, direction)] = self._bytes.get((route, backend, direction), 0) + value
+            self._images[(route, backend)] = self._images.get((route, backend), 0) + metrics.images
+
+    def prometheus_text(self) -> str:
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            lines.append(f"# HELP {ns}_generation_calls_total Generation calls by outcome.")
+            lines.append(f"# TYPE {ns}_generation_calls_total counter")
+            for (route, backend, outcome), count in sorted(self._calls.items()):
+                lines.append(f"{ns}_generation_calls_total{_labels(route=route, backend=backend, outcome=outcome)} {count}")
+
+            lines.append(f"# HELP {ns}_generation_stage_seconds Time spent in each stage of a generation call.")
+            lines.append(f"# TYPE {ns}_generation_stage_seconds histogram")
+            for (route, backend, stage), histogram in sorted(self._stages.items()):
+                name = f"{ns}_generation_stage_seconds"
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{_labels(route=route, backend=backend, stage=stage, le=repr(bound))} {count}")
+                lines.append(f"{name}_bucket{_labels(route=route, backend=backend, stage=stage, le='+Inf')} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(route=route, backend=backend, stage=stage)} {histogram.sum!r}")
+                lines.append(f"{name}_count{_labels(route=route, backend=backend, stage=stage)} {histogram.count}")
+
+            lines.append(f"# HELP {ns}_generation_bytes_total Payload bytes sent and received.")
+            lines.append(f"# TYPE {ns}_generation_bytes_total counter")
+            for (route, backend, direction), value in sorted(self._bytes.items()):
+                lines.append(f"{ns}_generation_bytes_total{_labels(route=route, backend=backend, direction=direction)} {value}")
+
+            lines.append(f"# HELP {ns}_generation_images_total Images returned.")
+            lines.append(f"# TYPE {ns}_generation_images_total counter")
+            for (route, backend), value in sorted(self._images.items()):
+                lines.append(f"{ns}_generation_images_total{_labels(route=route, backend=backend)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class JSONLinesExporter:
+    """`on_metrics` hook that appends every call as one JSON object per line"""
+
+    def __init__(self, target: str | IO[str]):
+        self._owns_stream = isinstance(target, str)
+        self.stream = open(target, "a", encoding="utf-8") if self._owns_stream else target
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: CallMetrics) -> None:
+        line = json.dumps(metrics.as_dict())
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def close(self) -> None:
+        if self._owns_stream:
+            self.stream.close()
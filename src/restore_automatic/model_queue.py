@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from .client import SDClient, get_default_client
+
+# what a job needs loaded: (checkpoint, CLIP skip), (None, None) runs on whatever is loaded
+GroupKey = tuple[str | None, int | None]
+ANY_MODEL: GroupKey = (None, None)
+
+
+class Job:
+    def __init__(self, operation: str, args: tuple, kwargs: dict):
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+        model = kwargs.pop("model_name", None)
+        clip_skip = kwargs.pop("CLIP_stop_at_last_layers", 2)
+        self.group: GroupKey = (model, clip_skip) if model is not None else ANY_MODEL
+
+    def __repr__(self) -> str:
+        return f"Job({self.operation!r}, model={self.group[0]!r})"
+
+
+class ModelAffinityQueue:
+    """
+    Job queue that runs pending jobs grouped by checkpoint and CLIP skip, so the backend only
+    swaps weights when a group drains instead of on every request that names a different model.
+    The checkpoint is switched once through the options endpoint and jobs are then sent without
+    `override_settings`. To keep one busy model from starving the rest, a group gives way after
+    `max_consecutive` jobs or once another group's oldest job has waited `max_wait` seconds.
+    """
+
+    def __init__(
+            self,
+            client: SDClient = None,
+            concurrency: int = 1,
+            max_consecutive: int = 32,
+            max_wait: float = 300.0
+        ):
+        self.client = client or get_default_client()
+        self.concurrency = concurrency
+        self.max_consecutive = max_consecutive
+        self.max_wait = max_wait
+
+        self.current: GroupKey | None = None
+        self.switches = 0
+        self._consecutive = 0
+        self._groups: OrderedDict[GroupKey, deque[Job]] = OrderedDict()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="sd-model-queue", daemon=True)
+        self._dispatcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def submit(self, operation: str, *args, **kwargs) -> Future:
+        """Queues `SDClient.<operation>(*args, **kwargs)` and returns a future for its result"""
+        job = Job(operation, args, kwargs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ModelAffinityQueue is closed")
+            self._groups.setdefault(job.group, deque()).append(job)
+            self._cond.notify_all()
+        return job.future
+
+    def img2img(self, *args, **kwargs) -> Future:
+        return self.submit("img2img", *args, **kwargs)
+
+    def txt2img(self, *args, **kwargs) -> Future:
+        return self.submit("txt2img", *args, **kwargs)
+
+    def inpaint(self, *args, **kwargs) -> Future:
+        return self.submit("inpaint", *args, **kwargs)
+
+    def pending(self) -> dict[GroupKey, int]:
+        with self._cond:
+            return {key: len(jobs) for key, jobs in self._groups.items()}
+
+    def close(self, wait: bool = True) -> None:
+        """Stops accepting jobs, by default after everything already queued has run"""
+        with self._cond:
+            self._closed = True
+            if not wait:
+                for jobs in self._groups.values():
+                    for job in jobs:
+                        job.future.cancel()
+                self._groups.clear()
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _starving(self, now: float) -> bool:
+        for key, jobs in self._groups.items():
+            if key != self.current and jobs and now - jobs[0].enqueued_at > self.max_wait:
+                return True
+        return False
+
+    def _next_job(self) -> tuple[Job, bool]:
+        """Picks the next job, and whether the backend has to switch checkpoints for it"""
+        now = time.monotonic()
+        current = self._groups.get(self.current)
+        keep_going = self._consecutive < self.max_consecutive and not self._starving(now)
+
+        if current and keep_going:
+            return current.popleft(), False
+        if self._groups.get(ANY_MODEL) and keep_going:
+            return self._groups[ANY_MODEL].popleft(), False
+
+        # switch to the group that has been waiting the longest
+        key = min((k for k, jobs in self._groups.items() if jobs), key=lambda k: self._groups[k][0].enqueued_at)
+        job = self._groups[key].popleft()
+        if key == self.current:
+            self._consecutive = 0
+        return job, key != ANY_MODEL and key != self.current
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                while not any(self._groups.values()) or self._in_flight >= self.concurrency:
+                    if self._closed and not any(self._groups.values()):
+                        return
+                    self._cond.wait()
+
+                job, switch = self._next_job()
+                # claimed here rather than in `_run`, so a job cancelled while it waited
+                # neither triggers a checkpoint swap nor gets a result set on it
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                if switch:
+                    # a checkpoint swap applies to the whole backend, let running jobs finish first
+                    while self._in_flight:
+                        self._cond.wait()
+                self._in_flight += 1
+
+            if switch:
+                try:
+                    self.client.set_model(*job.group)
+                except Exception as e:
+                    job.future.set_exception(e)
+                    self._job_done()
+                    with self._cond:
+                        self.current = None
+                    continue
+                with self._cond:
+                    self.current = job.group
+                    self.switches += 1
+                    self._consecutive = 0
+
+            with self._cond:
+                if job.group != ANY_MODEL:
+                    self._consecutive += 1
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: Job) -> None:
+        try:
+            result = getattr(self.client, job.operation)(*job.args, **job.kwargs)
+        except Exception as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        self._job_done()
+
+    def _job_done(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
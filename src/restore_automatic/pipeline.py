@@ -0,0 +1,118 @@
+import base64
+import binascii
+import io
+import time
+from typing import Callable
+from PIL import Image
+from .client import SDClient, ImageDecoder, get_default_client
+from .types import EncodedImage, UpscalePass
+from .utils import bytes_to_pillowimg
+
+# enough base64 for the header of any PNG/WEBP and of most JPEGs
+_HEADER_CHARS = 1 << 16
+
+_MAGIC = (
+    (b"\x89PNG", "PNG"),
+    (b"\xff\xd8", "JPEG"),
+    (b"RIFF", "WEBP"),
+)
+
+
+def sniff_format(image_bytes: bytes) -> str:
+    for magic, fmt in _MAGIC:
+        if image_bytes.startswith(magic):
+            return fmt
+    return "PNG"
+
+
+def wrap_encoded(image_bytes: bytes) -> EncodedImage:
+    """Turns result bytes back into an upload without decoding the pixels"""
+    start = time.perf_counter()
+    data = base64.b64encode(image_bytes).decode("ascii")
+    return EncodedImage(data, sniff_format(image_bytes), len(image_bytes), time.perf_counter() - start)
+
+
+def image_size(img: str | Image.Image | EncodedImage) -> tuple[int, int]:
+    """Width and height from the image header, pixels are never decoded"""
+    if isinstance(img, Image.Image):
+        return img.size
+    if isinstance(img, EncodedImage):
+        try:
+            with Image.open(io.BytesIO(base64.b64decode(img.data[:_HEADER_CHARS]))) as header:
+                return header.size
+        except (OSError, binascii.Error):
+            # the header didn't fit, e.g. a JPEG with a large EXIF block
+            with Image.open(io.BytesIO(base64.b64decode(img.data))) as full:
+                return full.size
+    with Image.open(img) as header:
+        return header.size
+
+
+def plan_passes(scale: float, passes: int, denoising_strength: float, steps: int = 20, cfg_scale: float = None) -> list[UpscalePass]:
+    """Splits one overall `scale` into `passes` equal geometric steps with the same settings"""
+    step = scale ** (1 / passes)
+    return [UpscalePass(step, denoising_strength, steps, cfg_scale) for _ in range(passes)]
+
+
+def progressive_upscale(
+        base_img: str | Image.Image | EncodedImage,
+        prompt: str,
+        passes: list[UpscalePass],
+        client: SDClient = None,
+        decoder: ImageDecoder = None,
+        source_size: tuple[int, int] = None,
+        on_pass: Callable[[int, int], None] = None,
+        should_stop: Callable[[], bool] = None,
+        **kwargs
+    ) -> list:
+    """
+    Runs img2img once per pass, each at the previous size times the pass's `scale`.
+    The encoded result of one pass is uploaded as the next pass's init image as is, so
+    intermediates are never decoded or re-encoded on this side. Returns the decoded outputs
+    of the passes marked `keep` followed by the final one. `width` and `height`, when given,
+    fix the size of the final pass.
+    `client` can be an `SDClient` or a `BackendScheduler`. `source_size` skips reading the
+    size from `base_img`, and `should_stop` is checked between passes to cancel early, in
+    which case only the outputs kept so far are returned.
+    """
+    if not passes:
+        raise ValueError("progressive_upscale needs at least one pass")
+    client = client or get_default_client()
+    decoder = decoder or getattr(client, "image_decoder", bytes_to_pillowimg)
+    width, height = source_size or image_size(base_img)
+    kwargs["batch_size"] = 1
+    cfg_scale = kwargs.pop("cfg_scale", 7)
+    final_size = kwargs.pop("width", None), kwargs.pop("height", None)
+    # every pass brings its own
+    for item in ("denoising_strength", "steps"):
+        kwargs.pop(item, None)
+
+    current = base_img
+    kept = []
+    for index, upscale in enumerate(passes):
+        if index > 0 and should_stop is not None and should_stop():
+            break
+        last = index == len(passes) - 1
+        width = max(8, round(width * upscale.scale))
+        height = max(8, round(height * upscale.scale))
+        if last:
+            # rounding drifts over several passes, land on the exact size when one was asked for
+            width = final_size[0] or width
+            height = final_size[1] or height
+        image_bytes = client.img2img(
+            current, prompt,
+            decoder=lambda b: b,
+            width=width,
+            height=height,
+            denoising_strength=upscale.denoising_strength,
+            steps=upscale.steps,
+            cfg_scale=upscale.cfg_scale if upscale.cfg_scale is not None else cfg_scale,
+            **kwargs
+        )[0]
+        if upscale.keep or last:
+            kept.append(decoder(image_bytes))
+        if not last:
+            current = wrap_encoded(image_bytes)
+        if on_pass is not None:
+            on_pass(index + 1, len(passes))
+    return kept
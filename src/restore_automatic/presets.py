@@ -0,0 +1,15 @@
+from .types import Preset
+from .utils import DEFAULT_RESTORE_PROMPT, DEFAULT_RESTORE_NEGATIVE_PROMPT
+
+PRESETS = {
+    "Restoration": Preset(
+        prompt=DEFAULT_RESTORE_PROMPT,
+        negative_prompt=DEFAULT_RESTORE_NEGATIVE_PROMPT,
+        denoising_strength=0.30
+    ),
+    "Upscaling": Preset(
+        prompt=DEFAULT_RESTORE_PROMPT,
+        negative_prompt=DEFAULT_RESTORE_NEGATIVE_PROMPT,
+        denoising_strength=0.05
+    ),
+}
@@ -0,0 +1,190 @@
+import base64
+import threading
+import time
+import uuid
+from typing import Callable
+import requests
+from .client import SDClient, get_default_client
+from .types import SDProgress
+from .utils import bytes_to_pillowimg
+
+ProgressCallback = Callable[[SDProgress], None]
+
+
+def new_task_id() -> str:
+    """Task id to pass as `task_id` to a generation so its progress can be followed"""
+    return f"task({uuid.uuid4().hex})"
+
+
+def parse_progress(jsn: dict, task_id: str = None, decode_preview: bool = False) -> SDProgress:
+    preview = None
+    data_url = jsn.get("live_preview")
+    if decode_preview and data_url:
+        preview = bytes_to_pillowimg(base64.b64decode(data_url.split(",", 1)[-1]))
+
+    return SDProgress(
+        progress=jsn.get("progress") or 0.0,
+        eta_relative=jsn.get("eta") or 0.0,
+        task_id=task_id,
+        active=bool(jsn.get("active")),
+        queued=bool(jsn.get("queued")),
+        completed=bool(jsn.get("completed")),
+        textinfo=jsn.get("textinfo"),
+        id_live_preview=jsn.get("id_live_preview", -1),
+        live_preview=preview
+    )
+
+
+class _Watch:
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.id_live_preview = -1
+        self.last_progress = -1.0
+        self.last_change = time.monotonic()
+        self.interval = 0.0
+        self.next_poll = 0.0
+
+
+class ProgressMonitor:
+    """
+    Follows the progress of running tasks from a single background thread.
+    Each watched task is polled on its own schedule: slowly while it is queued, and more often
+    as its ETA runs out. Live previews are only requested and decoded while at least one
+    subscriber wants them. A task is dropped automatically once it reports completion.
+    """
+
+    def __init__(
+            self,
+            client: SDClient = None,
+            min_interval: float = 0.25,
+            max_interval: float = 2.0,
+            stall_timeout: float = 60.0
+        ):
+        self.client = client or get_default_client()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stall_timeout = stall_timeout
+        self.last_error: Exception | None = None
+
+        self._subscribers: dict[int, tuple[ProgressCallback, bool]] = {}
+        self._next_id = 0
+        self._watches: dict[str, _Watch] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sd-progress", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def subscribe(self, callback: ProgressCallback, previews: bool = False) -> int:
+        """Registers a callback for every update, returns an id for `unsubscribe`"""
+        with self._lock:
+            self._next_id += 1
+            self._subscribers[self._next_id] = (callback, previews)
+            return self._next_id
+
+    def unsubscribe(self, subscription: int) -> None:
+        with self._lock:
+            self._subscribers.pop(subscription, None)
+
+    def watch(self, task_id: str) -> None:
+        with self._lock:
+            self._watches.setdefault(task_id, _Watch(task_id))
+        self._wake.set()
+
+    def unwatch(self, task_id: str) -> None:
+        with self._lock:
+            self._watches.pop(task_id, None)
+
+    @property
+    def watching(self) -> list[str]:
+        with self._lock:
+            return list(self._watches)
+
+    def _wants_previews(self) -> bool:
+        with self._lock:
+            return any(previews for _, previews in self._subscribers.values())
+
+    def next_interval(self, update: SDProgress) -> float:
+        if not update.active:
+            return self.max_interval
+        if update.eta_relative <= 0:
+            return self.min_interval
+        # aim for roughly ten updates over the remaining time
+        return min(self.max_interval, max(self.min_interval, update.eta_relative / 10))
+
+    def poll(self, watch: _Watch) -> SDProgress | None:
+        previews = self._wants_previews()
+        try:
+            jsn = self.client.get_progress(watch.task_id, watch.id_live_preview, previews)
+        except (requests.RequestException, ValueError) as e:
+            self.last_error = e
+            watch.interval = self.max_interval
+            return None
+
+        update = parse_progress(jsn, watch.task_id, previews)
+        now = time.monotonic()
+        if update.id_live_preview != -1:
+            watch.id_live_preview = update.id_live_preview
+        if update.progress != watch.last_progress or not update.active:
+            watch.last_progress = update.progress
+            watch.last_change = now
+        update.stalled = update.active and now - watch.last_change > self.stall_timeout
+        watch.interval = self.next_interval(update)
+        return update
+
+    def _publish(self, update: SDProgress) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for callback, previews in subscribers:
+            if previews or update.live_preview is None:
+                callback(update)
+            else:
+                callback(SDProgress(**{**update.__dict__, "live_preview": None}))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                watches = list(self._watches.values())
+
+            if not watches:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            now = time.monotonic()
+            for watch in watches:
+                if watch.next_poll > now:
+                    continue
+                update = self.poll(watch)
+                watch.next_poll = time.monotonic() + watch.interval
+                if update is None:
+                    continue
+                if update.completed:
+                    self.unwatch(watch.task_id)
+                self._publish(update)
+
+            with self._lock:
+                upcoming = [w.next_poll for w in self._watches.values()]
+            if upcoming:
+                self._wake.wait(max(0.0, min(upcoming) - time.monotonic()))
+                self._wake.clear()
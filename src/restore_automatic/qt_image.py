@@ -0,0 +1,71 @@
+import base64
+import time
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice
+from PySide6.QtGui import QImage
+from PIL import Image
+from .types import EncodeOptions, EncodedImage
+from .utils import encode_image
+
+# pillow modes that have a QImage format with the exact same memory layout
+_PIL_TO_QT = {
+    "RGBA": QImage.Format_RGBA8888,
+    "RGB": QImage.Format_RGB888,
+    "L": QImage.Format_Grayscale8,
+}
+_QT_TO_PIL = {fmt: mode for mode, fmt in _PIL_TO_QT.items()}
+
+
+def qimage_to_pil(qimage: QImage) -> Image.Image:
+    """
+    Wraps a QImage's pixels as a read-only pillow image without copying them when the
+    format allows it, otherwise converts once to RGBA8888.
+    """
+    mode = _QT_TO_PIL.get(qimage.format())
+    if mode is None:
+        qimage = qimage.convertToFormat(QImage.Format_RGBA8888)
+        mode = "RGBA"
+
+    img = Image.frombuffer(
+        mode, (qimage.width(), qimage.height()),
+        qimage.constBits(), "raw", mode, qimage.bytesPerLine(), 1
+    )
+    # the pillow image reads straight out of the QImage's memory, keep it alive
+    img._qimage = qimage
+    return img
+
+
+def pil_to_qimage(img: Image.Image) -> QImage:
+    """Builds a QImage over a single copy of the pillow image's pixels"""
+    if img.mode not in _PIL_TO_QT:
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+    data = img.tobytes()
+    bytes_per_line = len(data) // img.height if img.height else 0
+    # QImage keeps a reference to `data`, so nothing is copied here
+    return QImage(data, img.width, img.height, bytes_per_line, _PIL_TO_QT[img.mode])
+
+
+def qimage_from_bytes(image_bytes: bytes) -> QImage:
+    """Decodes PNG/JPEG/... bytes straight into a QImage, skipping pillow entirely"""
+    qimage = QImage.fromData(image_bytes)
+    if qimage.isNull():
+        raise ValueError("Could not decode image")
+    return qimage
+
+
+def encode_qimage(qimage: QImage, options: EncodeOptions = None) -> EncodedImage:
+    """Encodes a QImage for upload, with Qt's own PNG encoder when possible"""
+    options = options or EncodeOptions()
+    if options.format.upper() != "PNG":
+        return encode_image(qimage_to_pil(qimage), options)
+
+    start = time.perf_counter()
+    raw = QByteArray()
+    buffer = QBuffer(raw)
+    buffer.open(QIODevice.WriteOnly)
+    # Qt maps PNG quality 0-100 onto zlib levels 9-0
+    qimage.save(buffer, "PNG", round(100 - options.compress_level * 100 / 9))
+    buffer.close()
+
+    data = base64.b64encode(raw.data()).decode("ascii")
+    return EncodedImage(data, "PNG", raw.size(), time.perf_counter() - start)
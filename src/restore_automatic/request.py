@@ -0,0 +1,131 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Iterator
+from .types import Routes, EncodedImage
+
+DEFAULT_NEGATIVES = "lowres, bad anatomy, bad hands, text, error, missing fingers, extra digit, fewer digits, cropped, worst quality, low quality, normal quality, jpeg artifacts, signature, watermark, username, blurry"
+
+# payload fields that hold base64 images, these are streamed instead of serialized
+IMAGE_FIELDS = ("init_images", "mask")
+
+# how much of an image string is turned into bytes at a time while sending
+BODY_CHUNK_SIZE = 1 << 16
+
+# stands in for an image while the rest of the payload is serialized
+_PLACEHOLDER = "\0image-{}\0"
+_PLACEHOLDER_JSON = re.compile(r'"\\u0000image-(\d+)\\u0000"')
+
+
+@dataclass
+class GenerationRequest:
+    """
+    Every parameter of one generation. With an `init_image` it is an img2img call, with a
+    `mask` as well an inpaint, and a txt2img otherwise. `payload()` builds the dict the
+    webui api expects, `JSONBody` streams it.
+    """
+    prompt: str
+    negative_prompt: str = DEFAULT_NEGATIVES
+    model_name: str | None = None
+    steps: int = 10
+    cfg_scale: float = 7
+    denoising_strength: float = 7.5
+    width: int = 512
+    height: int = 512
+    restore_faces: bool = False
+    batch_size: int = 2
+    # batches run back to back, seeds keep counting up across them
+    n_iter: int = 1
+    seed: int = -1
+    CLIP_stop_at_last_layers: int = 2
+    task_id: str | None = None
+    init_image: EncodedImage | None = None
+    mask: EncodedImage | None = None
+
+    @property
+    def route(self) -> str:
+        return Routes.TXT2IMG if self.init_image is None else Routes.IMG2IMG
+
+    def payload(self) -> dict:
+        payload = {
+            "prompt": self.prompt,
+            "negative_prompt": self.negative_prompt,
+            "steps": self.steps,
+            "batch_size": self.batch_size,
+            "width": self.width,
+            "height": self.height,
+            "cfg_scale": self.cfg_scale,
+            "seed": self.seed,
+            "denoising_strength": self.denoising_strength,
+            "restore_faces": self.restore_faces
+        }
+
+        if self.n_iter != 1:
+            payload["n_iter"] = self.n_iter
+
+        if self.model_name is not None:
+            payload["override_settings"] = {
+                "sd_model_checkpoint": self.model_name,
+                "CLIP_stop_at_last_layers": self.CLIP_stop_at_last_layers,
+            }
+            if self.init_image is None:
+                payload["override_settings"]["show_progress_every_n_steps"] = 1
+
+        if self.task_id is not None:
+            payload["force_task_id"] = self.task_id
+
+        if self.mask is not None:
+            # the crop is cut and feathered client side, see `bounded_inpaint`, so the webui's own
+            # "only masked" mode would only crop it again and lose the context padding
+            payload.update({
+                "mask": self.mask.data, "mask_blur_x": 0, "mask_blur_y": 0, "mask_blur": 0,
+                "inpaint_full_res": False
+            })
+        if self.init_image is not None:
+            payload["init_images"] = [self.init_image.data]
+        return payload
+
+
+class JSONBody:
+    """
+    JSON request body that is written out piece by piece. The small fields are serialized
+    once up front, the base64 images are sent straight from the payload's strings a chunk at
+    a time, so the multi-megabyte document is never built in memory. Has a length, so it
+    goes out with a Content-Length instead of chunked transfer encoding.
+    """
+
+    def __init__(self, payload: dict, chunk_size: int = BODY_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        images = []
+        skeleton = dict(payload)
+        for field in IMAGE_FIELDS:
+            value = skeleton.get(field)
+            if isinstance(value, str):
+                skeleton[field] = self._placeholder(images, value)
+            elif isinstance(value, list):
+                skeleton[field] = [self._placeholder(images, v) if isinstance(v, str) else v for v in value]
+
+        pieces = _PLACEHOLDER_JSON.split(json.dumps(skeleton, allow_nan=False))
+        # base64 needs no escaping, so every image goes between the quotes its placeholder had
+        self.parts: list[bytes | str] = [pieces[0].encode("utf-8")]
+        for index, text in zip(pieces[1::2], pieces[2::2]):
+            self.parts.append(b'"')
+            self.parts.append(images[int(index)])
+            self.parts.append(('"' + text).encode("utf-8"))
+        self.length = sum(len(part) for part in self.parts)
+
+    @staticmethod
+    def _placeholder(images: list[str], value: str) -> str:
+        images.append(value)
+        return _PLACEHOLDER.format(len(images) - 1)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            for start in range(0, len(part), self.chunk_size):
+                yield part[start:start + self.chunk_size].encode("ascii")
@@ -0,0 +1,322 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import requests
+from .client import SDClient, DeadlineExceeded, deadline_at
+from .progress import new_task_id
+
+# operations that are safe to send twice, the loser is interrupted
+HEDGEABLE = ("img2img", "txt2img", "inpaint")
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class Backend:
+    """A webui instance plus the load and health state the scheduler tracks for it"""
+
+    def __init__(self, client: SDClient | str):
+        self.client = client if isinstance(client, SDClient) else SDClient(client)
+        self.in_flight = 0
+        # the webui reports work running or queued, which may not be ours
+        self.remote_busy = False
+        self.healthy = True
+        self.failures = 0
+        self.last_check = 0.0
+        self.last_error: Exception | None = None
+
+    def __repr__(self) -> str:
+        state = "healthy" if self.healthy else "down"
+        return f"Backend({self.client.base_url!r}, {state}, load={self.load})"
+
+    @property
+    def load(self) -> int:
+        """Jobs we have outstanding on it, plus one if the webui reports work we didn't send"""
+        return self.in_flight + (1 if self.remote_busy and self.in_flight == 0 else 0)
+
+    def check_health(self) -> bool:
+        try:
+            state = self.client.get_state().get("state") or {}
+            self.client.list_models()
+        except (requests.RequestException, ValueError) as e:
+            self.mark_failed(e)
+        else:
+            self.remote_busy = bool(state.get("job_count") or state.get("job"))
+            self.healthy = True
+            self.failures = 0
+            self.last_error = None
+        self.last_check = time.monotonic()
+        return self.healthy
+
+    def mark_failed(self, err: Exception) -> None:
+        self.healthy = False
+        self.failures += 1
+        self.last_error = err
+        self.last_check = time.monotonic()
+
+
+class _Attempt:
+    """One copy of a hedged call, which backend it ended up on and the task id to interrupt it by"""
+
+    def __init__(self, task_id: str, avoid: tuple[Backend, ...] = ()):
+        self.task_id = task_id
+        self.avoid = avoid
+        self.backend: Backend | None = None
+        self.cancelled = False
+        # set once the copy reaches a backend, or gives up before it does
+        self.started = threading.Event()
+
+
+class BackendScheduler:
+    """
+    Spreads generation jobs across several webui instances.
+    Each job goes to the healthy backend with the fewest outstanding jobs, and is
+    retried on the next one if its backend drops the connection.
+
+    With `hedge_percentile` set, a generation still running after that percentile of recent
+    latencies (`hedge_delay` until `hedge_min_samples` calls have been seen) is sent again to
+    another backend. Whichever answers first wins and the other copy is interrupted.
+    """
+
+    def __init__(
+            self,
+            backends: list[SDClient | str],
+            health_interval: float = 10.0,
+            hedge_percentile: float = None,
+            hedge_delay: float = 30.0,
+            hedge_min_samples: int = 20,
+            latency_window: int = 200
+        ):
+        if not backends:
+            raise ValueError("BackendScheduler needs at least one backend")
+
+        self.backends = [Backend(b) for b in backends]
+        self.health_interval = health_interval
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies: dict[str, deque[float]] = {}
+        self._latency_window = latency_window
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Starts polling every backend's health in the background"""
+        if self._health_thread is not None:
+            return
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=self._health_loop, name="sd-health", daemon=True)
+        self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+            self._health_thread = None
+
+    def close(self) -> None:
+        self.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.client.close()
+
+    def _health_loop(self) -> None:
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(self.health_interval)
+
+    def check_health(self) -> list[Backend]:
+        """Polls every backend once and returns the healthy ones"""
+        for backend in self.backends:
+            backend.check_health()
+        return [b for b in self.backends if b.healthy]
+
+    def pick(self, exclude: tuple[Backend, ...] = ()) -> Backend:
+        """
+        Reserves the least loaded healthy backend, the caller must `release` it.
+        Backends that have been down for `health_interval` are probed again first, so a
+        scheduler that was never `start`ed still gets them back after a connection blip.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                b for b in self.backends
+                if not b.healthy and b not in exclude and now - b.last_check >= self.health_interval
+            ]
+            # claimed under the lock so concurrent picks don't all probe the same backend
+            for backend in stale:
+                backend.last_check = now
+        for backend in stale:
+            backend.check_health()
+
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                raise NoBackendAvailable(f"No healthy backend out of {len(self.backends)}")
+            backend = min(candidates, key=lambda b: b.load)
+            backend.in_flight += 1
+            return backend
+
+    def release(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+
+    def record_latency(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._latencies.get(operation)
+            if samples is None:
+                samples = self._latencies[operation] = deque(maxlen=self._latency_window)
+            samples.append(seconds)
+
+    def hedge_after(self, operation: str) -> float:
+        """Seconds to wait on a call before sending a hedged copy"""
+        with self._lock:
+            samples = sorted(self._latencies.get(operation, ()))
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_delay
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+
+    def run(self, operation: str, *args, deadline: float = None, **kwargs):
+        """
+        Calls `SDClient.<operation>` on the best backend, failing over on connection errors.
+        `deadline` is how many seconds the call may take in total, failovers and hedges included.
+        """
+        due = deadline_at(deadline)
+        healthy = sum(1 for b in self.backends if b.healthy)
+        if self.hedge_percentile is not None and operation in HEDGEABLE and healthy > 1:
+            return self._run_hedged(operation, args, kwargs, due)
+        return self._run(operation, args, kwargs, due)
+
+    def _run(self, operation: str, args: tuple, kwargs: dict, due: float = None, attempt: _Attempt = None):
+        avoid = attempt.avoid if attempt is not None else ()
+        tried = ()
+        while True:
+            try:
+                backend = self.pick(exclude=avoid + tried)
+            except NoBackendAvailable as e:
+                if tried:
+                    raise e from tried[-1].last_error
+                raise
+            if attempt is not None:
+                attempt.backend = backend
+                attempt.started.set()
+            try:
+                call_kwargs = kwargs
+                if due is not None:
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"Deadline passed before {operation} could be sent")
+                    call_kwargs = dict(kwargs, deadline=remaining)
+                start = time.monotonic()
+                result = getattr(backend.client, operation)(*args, **call_kwargs)
+                if attempt is None or not attempt.cancelled:
+                    self.record_latency(operation, time.monotonic() - start)
+                return result
+            except DeadlineExceeded:
+                # slow is not dead, and there is no time left to try elsewhere anyway
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                backend.mark_failed(e)
+                tried += (backend,)
+            except requests.HTTPError as e:
+                # 5xx means the backend itself is in trouble, 4xx is a bad payload and fails anywhere
+                if e.response is None or e.response.status_code < 500:
+                    raise
+                backend.mark_failed(e)
+                tried += (backend,)
+            finally:
+                self.release(backend)
+
+    def _submit(self, operation: str, args: tuple, kwargs: dict, due: float | None, attempt: _Attempt) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4 * len(self.backends), thread_name_prefix="sd-hedge")
+        # every copy gets its own task id, so the loser can be told apart on its backend
+        return self._executor.submit(self._run_attempt, operation, args, dict(kwargs, task_id=attempt.task_id), due, attempt)
+
+    def _run_attempt(self, operation: str, args: tuple, kwargs: dict, due: float | None, attempt: _Attempt):
+        try:
+            return self._run(operation, args, kwargs, due, attempt)
+        finally:
+            attempt.started.set()
+
+    def _run_hedged(self, operation: str, args: tuple, kwargs: dict, due: float = None):
+        primary = _Attempt(kwargs.get("task_id") or new_task_id())
+        attempts = {self._submit(operation, args, kwargs, due, primary): primary}
+
+        # the hedge timer runs from when the call reaches a backend, a copy still queued in the
+        # executor isn't slow, and hedging it would only double the load
+        primary.started.wait()
+        done, _ = wait(attempts, timeout=self.hedge_after(operation))
+        if not done:
+            hedge = _Attempt(new_task_id(), avoid=(primary.backend,) if primary.backend else ())
+            attempts[self._submit(operation, args, kwargs, due, hedge)] = hedge
+            with self._lock:
+                self.hedges += 1
+
+        # the first success wins, an error only counts once every copy has failed
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        self._cancel(attempts[loser], loser)
+                    if attempts[future] is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _cancel(self, attempt: _Attempt, future: Future, poll_interval: float = 0.5) -> None:
+        """Interrupts a losing copy once its backend starts on it, or drops it if it never does"""
+        attempt.cancelled = True
+
+        def interrupt_loser():
+            while not future.done():
+                backend = attempt.backend
+                if backend is not None:
+                    try:
+                        if backend.client.interrupt_task(attempt.task_id):
+                            return
+                    except (requests.RequestException, ValueError):
+                        return
+                time.sleep(poll_interval)
+
+        threading.Thread(target=interrupt_loser, name="sd-hedge-cancel", daemon=True).start()
+
+    def img2img(self, *args, **kwargs):
+        return self.run("img2img", *args, **kwargs)
+
+    def txt2img(self, *args, **kwargs):
+        return self.run("txt2img", *args, **kwargs)
+
+    def inpaint(self, *args, **kwargs):
+        return self.run("inpaint", *args, **kwargs)
+
+    def interrupt(self) -> bool:
+        """Interrupts whatever is running on every healthy backend"""
+        results = []
+        for backend in self.backends:
+            if backend.healthy:
+                try:
+                    results.append(backend.client.interrupt())
+                except requests.RequestException as e:
+                    backend.mark_failed(e)
+        return any(results)
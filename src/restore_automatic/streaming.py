@@ -0,0 +1,116 @@
+import base64
+import json
+import re
+from typing import Iterable, Iterator
+
+_STRUCTURE = re.compile(rb'["{}\[\],:]')
+_STRING_STOP = re.compile(rb'["\\]')
+
+
+class JSONArrayScanner:
+    """
+    Incrementally pulls the strings out of one top level array of a JSON object, e.g. the
+    `images` of a webui response, without ever holding the whole body.
+    Feed it the body in chunks, every base64 string is yielded as soon as its closing quote
+    arrives, so at most one of them is buffered at a time.
+    """
+
+    def __init__(self, key: str = "images"):
+        self.key = key.encode()
+        self.depth = 0
+        self.expect_key = False
+        self.last_key = None
+        self.key_matched = False
+        self.array_depth = None
+
+        self.in_string = False
+        self.escape = False
+        self.capture = False
+        self.has_escapes = False
+        self.parts: list[bytes] = []
+
+    def feed(self, chunk: bytes) -> Iterator[bytes]:
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self.in_string:
+                if self.escape:
+                    if self.capture:
+                        self.parts.append(chunk[pos:pos + 1])
+                    self.escape = False
+                    pos += 1
+                    continue
+                match = _STRING_STOP.search(chunk, pos)
+                if match is None:
+                    if self.capture:
+                        self.parts.append(chunk[pos:])
+                    return
+                stop = match.start()
+                if chunk[stop] == 0x5C:  # backslash, keep it and skip whatever it escapes
+                    if self.capture:
+                        self.parts.append(chunk[pos:stop + 1])
+                        self.has_escapes = True
+                    self.escape = True
+                    pos = stop + 1
+                    continue
+                if self.capture:
+                    self.parts.append(chunk[pos:stop])
+                value = self._finish_string()
+                pos = stop + 1
+                if value is not None:
+                    yield value
+                continue
+
+            match = _STRUCTURE.search(chunk, pos)
+            if match is None:
+                return
+            token = chunk[match.start()]
+            pos = match.end()
+
+            if token == 0x22:  # "
+                self._start_string()
+            elif token in (0x7B, 0x5B):  # { [
+                self.depth += 1
+                if token == 0x5B and self.key_matched and self.depth == 2:
+                    self.array_depth = self.depth
+                self.key_matched = False
+                self.expect_key = token == 0x7B and self.depth == 1
+            elif token in (0x7D, 0x5D):  # } ]
+                if self.array_depth == self.depth:
+                    self.array_depth = None
+                self.depth -= 1
+            elif token == 0x2C:  # ,
+                self.expect_key = self.depth == 1
+                self.key_matched = False
+            elif token == 0x3A:  # :
+                self.expect_key = False
+                self.key_matched = self.depth == 1 and self.last_key == self.key
+
+    def _start_string(self) -> None:
+        self.in_string = True
+        self.has_escapes = False
+        self.parts = []
+        in_array = self.array_depth is not None and self.depth == self.array_depth
+        self.capture = in_array or (self.depth == 1 and self.expect_key)
+
+    def _finish_string(self) -> bytes | None:
+        self.in_string = False
+        if not self.capture:
+            return None
+        raw = b"".join(self.parts)
+        self.parts = []
+        if self.has_escapes:
+            raw = json.loads(b'"' + raw + b'"').encode()
+
+        if self.array_depth is not None and self.depth == self.array_depth:
+            return raw
+        self.last_key = raw
+        return None
+
+
+def iter_base64_images(chunks: Iterable[bytes], key: str = "images") -> Iterator[bytes]:
+    """Decodes every base64 image of a streamed webui response as soon as it is complete"""
+    scanner = JSONArrayScanner(key)
+    for chunk in chunks:
+        for b64 in scanner.feed(chunk):
+            yield base64.b64decode(b64)
@@ -0,0 +1,169 @@
+import itertools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from PIL import Image, ImageDraw, ImageFont
+from .client import SDClient, ImageDecoder, get_default_client
+from .types import EncodedImage
+from .utils import bytes_to_pillowimg, encode_image
+
+
+@dataclass
+class SweepCall:
+    """One backend call of a sweep, every seed in `seeds` comes back from it as one image"""
+    params: dict
+    seeds: list[int]
+    batch_size: int
+    n_iter: int
+
+
+@dataclass
+class SweepCell:
+    params: dict
+    image: object = field(repr=False)
+    # wall time of the call the cell came from, shared with the other seeds of that call
+    seconds: float
+    call: int
+
+
+@dataclass
+class SweepResult:
+    axes: dict[str, list]
+    cells: list[SweepCell]
+    calls: int
+    seconds: float
+
+    def get(self, **params) -> SweepCell:
+        """The cell whose parameters include all of `params`"""
+        for cell in self.cells:
+            if all(cell.params.get(k) == v for k, v in params.items()):
+                return cell
+        raise KeyError(params)
+
+
+def _seed_runs(seeds: list[int]) -> list[list[int]]:
+    """Splits seeds into runs of consecutive values, the webui counts seeds up within a call"""
+    runs = []
+    for seed in seeds:
+        if runs and seed != -1 and runs[-1][-1] == seed - 1:
+            runs[-1].append(seed)
+        else:
+            runs.append([seed])
+    return runs
+
+
+def _batching(count: int, max_batch: int) -> tuple[int, int]:
+    """batch_size and n_iter that make exactly `count` images in one call"""
+    batch = max(d for d in range(1, min(count, max_batch) + 1) if count % d == 0)
+    return batch, count // batch
+
+
+def plan_sweep(axes: dict[str, list], max_batch: int = 4) -> list[SweepCall]:
+    """
+    One call per combination of the non-seed axes. Consecutive seeds share that call through
+    `batch_size` and `n_iter`, so a 3x2 grid over 4 seeds takes 6 calls instead of 24.
+    """
+    seeds = axes.get("seed", [-1])
+    other = {name: values for name, values in axes.items() if name != "seed"}
+    calls = []
+    for combination in itertools.product(*other.values()):
+        params = dict(zip(other, combination))
+        for run in _seed_runs(seeds):
+            batch, n_iter = _batching(len(run), max_batch)
+            calls.append(SweepCall(params, run, batch, n_iter))
+    return calls
+
+
+def sweep(
+        base_img: str | Image.Image | EncodedImage | None,
+        prompt: str,
+        axes: dict[str, list | int],
+        client: SDClient = None,
+        max_batch: int = 4,
+        max_workers: int = 2,
+        decoder: ImageDecoder = None,
+        **kwargs
+    ) -> SweepResult:
+    """
+    Runs img2img (txt2img without `base_img`) over every combination of `axes`, e.g.
+    `{"denoising_strength": [0.2, 0.3], "cfg_scale": [5, 7], "seed": 4}`. Axis names are the
+    generation parameters, `prompt` included. A `seed` count picks that many consecutive seeds.
+    The init image is encoded once for the whole sweep and `max_workers` calls run at once.
+    `client` can be an `SDClient` or a `BackendScheduler`.
+    """
+    client = client or get_default_client()
+    decoder = decoder or getattr(client, "image_decoder", bytes_to_pillowimg)
+    axes = dict(axes)
+    if isinstance(axes.get("seed"), int):
+        start = random.randrange(2 ** 31 - axes["seed"])
+        axes["seed"] = list(range(start, start + axes["seed"]))
+    if base_img is not None and not isinstance(base_img, EncodedImage):
+        # an SDClient encodes with its own options and codec pool
+        encode = getattr(client, "encode", encode_image)
+        base_img = encode(base_img)
+
+    def run(call: SweepCall) -> tuple[list, float]:
+        params = dict(kwargs, **call.params)
+        params.update(seed=call.seeds[0], batch_size=call.batch_size, n_iter=call.n_iter)
+        call_prompt = params.pop("prompt", prompt)
+        start = time.perf_counter()
+        if base_img is None:
+            images = client.txt2img(call_prompt, decoder=decoder, **params)
+        else:
+            images = client.img2img(base_img, call_prompt, decoder=decoder, **params)
+        # a backend set to return grids puts one in front of the batch
+        images = images[-len(call.seeds):]
+        return images, time.perf_counter() - start
+
+    started = time.perf_counter()
+    calls = plan_sweep(axes, max_batch)
+    cells = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, (images, seconds) in enumerate(executor.map(run, calls)):
+            call = calls[index]
+            for seed, image in zip(call.seeds, images):
+                params = dict(call.params, seed=seed) if "seed" in axes else dict(call.params)
+                cells.append(SweepCell(params, image, seconds, index))
+    return SweepResult(axes, cells, len(calls), time.perf_counter() - started)
+
+
+def _label(params: dict) -> str:
+    return "\n".join(f"{name}={value}" for name, value in params.items())
+
+
+def contact_sheet(result: SweepResult, columns: str = None, thumb_size: int = 256, label_width: int = 180) -> Image.Image:
+    """
+    Lays a sweep out as a labeled grid, one column per value of `columns` (the seed axis or
+    the last axis by default) and one row per combination of the others. Every cell shows
+    the time of the call it came from. Needs a sweep decoded into pillow images.
+    """
+    if columns is None:
+        columns = "seed" if "seed" in result.axes else list(result.axes)[-1]
+    col_values = list(result.axes[columns])
+    rows: dict[tuple, dict] = {}
+    for cell in result.cells:
+        row = {k: v for k, v in cell.params.items() if k != columns}
+        rows.setdefault(tuple(row.items()), row)
+
+    font = ImageFont.load_default()
+    header = 24
+    sheet = Image.new("RGB", (label_width + thumb_size * len(col_values), header + thumb_size * len(rows)), "white")
+    draw = ImageDraw.Draw(sheet)
+    for c, value in enumerate(col_values):
+        draw.text((label_width + c * thumb_size + 4, 6), f"{columns}={value}", fill="black", font=font)
+
+    for r, (key, row) in enumerate(rows.items()):
+        top = header + r * thumb_size
+        draw.multiline_text((4, top + 4), _label(row), fill="black", font=font)
+        for c, value in enumerate(col_values):
+            try:
+                cell = result.get(**row, **{columns: value})
+            except KeyError:
+                continue
+            thumb = cell.image.convert("RGB")
+            thumb.thumbnail((thumb_size, thumb_size))
+            left = label_width + c * thumb_size
+            sheet.paste(thumb, (left, top))
+            draw.text((left + 4, top + max(0, thumb.height - 16)), f"{cell.seconds:.1f}s", fill="white", font=font, stroke_width=1, stroke_fill="black")
+    return sheet
@@ -0,0 +1,149 @@
+import math
+import threading
+from collections import OrderedDict
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsObject, QStyleOptionGraphicsItem, QWidget
+from PySide6.QtCore import QObject, QRectF, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QImage, QPainter, QPixmap
+
+TILE_SIZE = 256
+# roughly 256MB worth of 256x256 ARGB32 tiles
+MAX_CACHED_TILES = 1024
+
+
+class _PyramidSignals(QObject):
+    level_ready = Signal(int)
+
+
+class _BuildRunnable(QRunnable):
+    def __init__(self, pyramid: "ImagePyramid"):
+        super().__init__()
+        self.pyramid = pyramid
+
+    def run(self):
+        self.pyramid._build()
+
+
+class ImagePyramid:
+    """
+    Mip levels of an image, each half the size of the one before, down to a single tile.
+    Level 0 is the image itself, the others are built on a worker thread, coarsest last.
+    """
+
+    def __init__(self, image: QImage, tile_size: int = TILE_SIZE, pool: QThreadPool = None):
+        self.tile_size = tile_size
+        self.width = image.width()
+        self.height = image.height()
+        self.levels: list[QImage | None] = [image] + [None] * self._level_count(image)
+        self.signals = _PyramidSignals()
+        self._cancelled = threading.Event()
+        if len(self.levels) > 1:
+            (pool or QThreadPool.globalInstance()).start(_BuildRunnable(self))
+
+    def _level_count(self, image: QImage) -> int:
+        longest = max(image.width(), image.height(), 1)
+        return max(0, math.ceil(math.log2(longest / self.tile_size)))
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def level_for(self, scale: float) -> int:
+        """Finest level that is not more detailed than the screen can show at `scale`"""
+        if scale >= 1:
+            return 0
+        return min(int(math.log2(1 / scale)), len(self.levels) - 1)
+
+    def ready(self, level: int) -> bool:
+        return self.levels[level] is not None
+
+    def _build(self) -> None:
+        for level in range(1, len(self.levels)):
+            if self._cancelled.is_set():
+                return
+            prev = self.levels[level - 1]
+            self.levels[level] = prev.scaled(
+                max(1, prev.width() // 2), max(1, prev.height() // 2),
+                Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+            )
+            self.signals.level_ready.emit(level)
+
+
+class TiledImageItem(QGraphicsObject):
+    """
+    Graphics item that draws an image as tiles of the pyramid level matching the current zoom.
+    Only tiles inside the exposed area are turned into pixmaps, and those are kept in a bounded
+    LRU, so neither zooming out on a huge image nor panning at 100% uploads the whole thing.
+    """
+
+    def __init__(self, image: QImage, tile_size: int = TILE_SIZE, max_tiles: int = MAX_CACHED_TILES, pool: QThreadPool = None):
+        super().__init__()
+        self.image = image
+        self.max_tiles = max_tiles
+        self.pyramid = ImagePyramid(image, tile_size, pool)
+        self.pyramid.signals.level_ready.connect(self._level_ready)
+        self._tiles: OrderedDict[tuple[int, int, int], QPixmap] = OrderedDict()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    def release(self) -> None:
+        """Stops building levels and drops cached tiles, call before the item goes away"""
+        self.pyramid.cancel()
+        self._tiles.clear()
+
+    def tile(self, level: int, col: int, row: int) -> QPixmap:
+        key = (level, col, row)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            return pixmap
+
+        size = self.pyramid.tile_size
+        image = self.pyramid.levels[level]
+        x, y = col * size, row * size
+        # QImage.copy pads with zeros past the edge instead of clipping
+        pixmap = QPixmap.fromImage(image.copy(x, y, min(size, image.width() - x), min(size, image.height() - y)))
+        self._tiles[key] = pixmap
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None) -> None:
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.level_for(scale)
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if not self.pyramid.ready(level):
+            # until the level is built draw straight from the full image without caching tiles
+            painter.drawImage(exposed, self.image, exposed)
+            return
+
+        image = self.pyramid.levels[level]
+        factor = 2 ** level
+        size = self.pyramid.tile_size
+
+        # tile range covering the exposed area in the level's pixel space
+        first_col = max(0, int(exposed.left() / factor) // size)
+        first_row = max(0, int(exposed.top() / factor) // size)
+        last_col = min((image.width() - 1) // size, int(exposed.right() / factor) // size)
+        last_row = min((image.height() - 1) // size, int(exposed.bottom() / factor) // size)
+
+        painter.save()
+        # antialiased edges let the background bleed through the seams between tiles
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                pixmap = self.tile(level, col, row)
+                target = QRectF(
+                    col * size * factor, row * size * factor,
+                    pixmap.width() * factor, pixmap.height() * factor
+                )
+                # halving rounds sizes down, stretch edge tiles back out to the image bounds
+                if col == last_col and (col + 1) * size >= image.width():
+                    target.setRight(self.pyramid.width)
+                if row == last_row and (row + 1) * size >= image.height():
+                    target.setBottom(self.pyramid.height)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+        painter.restore()
+
+    def _level_ready(self, level: int) -> None:
+        self.update()
@@ -0,0 +1,126 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from PIL import Image, ImageChops
+from .client import SDClient, get_default_client
+
+
+def _axis_starts(length: int, tile: int, overlap: int) -> list[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, tile - overlap))
+    # the last tile is pushed back against the edge so every tile has the full size
+    starts.append(length - tile)
+    return starts
+
+
+def tile_boxes(width: int, height: int, tile_size: int = 512, overlap: int = 64) -> list[tuple[int, int, int, int]]:
+    """Splits an image into overlapping (left, top, right, bottom) boxes in row-major order"""
+    if tile_size <= 0:
+        raise ValueError(f"tile_size has to be positive, got {tile_size}")
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"overlap has to be at least 0 and smaller than tile_size ({tile_size}), got {overlap}")
+    tile_w = min(tile_size, width)
+    tile_h = min(tile_size, height)
+    boxes = []
+    for y in _axis_starts(height, tile_h, overlap):
+        for x in _axis_starts(width, tile_w, overlap):
+            boxes.append((x, y, x + tile_w, y + tile_h))
+    return boxes
+
+
+def _ramp(length: int, size: int, horizontal: bool) -> Image.Image:
+    """Mask that fades in over the first `length` pixels along one axis"""
+    line = Image.new("L", (size, 1) if horizontal else (1, size))
+    line.putdata([min(255, round(255 * (i + 1) / (length + 1))) for i in range(length)] + [255] * (size - length))
+    return line
+
+
+def feather_mask(box: tuple[int, int, int, int], left_overlap: int, top_overlap: int) -> Image.Image | None:
+    """Alpha mask that blends a tile into the tiles already pasted to its left and above it"""
+    w = box[2] - box[0]
+    h = box[3] - box[1]
+    if left_overlap <= 0 and top_overlap <= 0:
+        return None
+
+    mask = Image.new("L", (w, h), 255)
+    if left_overlap > 0:
+        mask = ImageChops.multiply(mask, _ramp(left_overlap, w, True).resize((w, h), Image.Resampling.NEAREST))
+    if top_overlap > 0:
+        mask = ImageChops.multiply(mask, _ramp(top_overlap, h, False).resize((w, h), Image.Resampling.NEAREST))
+    return mask
+
+
+def _round8(v: int) -> int:
+    return max(8, (v + 7) // 8 * 8)
+
+
+def tiled_img2img(
+        base_img: str | Image.Image,
+        prompt: str,
+        width: int = None,
+        height: int = None,
+        scale: float = None,
+        tile_size: int = 512,
+        overlap: int = 64,
+        client: SDClient = None,
+        max_workers: int = 1,
+        on_tile: Callable[[int, int], None] = None,
+        **kwargs
+    ) -> Image.Image:
+    """
+    Runs img2img over an image in overlapping tiles and blends the seams back together.
+    The source is first resized to the target size (`width`/`height` or `scale`), so this
+    doubles as an upscaler. `client` can be an `SDClient` or a `BackendScheduler`, and
+    `max_workers` tiles are kept in flight at once. Only the resized source, the output
+    and the in-flight tiles are held in memory.
+    """
+    if type(base_img) == str:
+        base_img = Image.open(base_img)
+    client = client or get_default_client()
+
+    if scale is not None:
+        width = round(base_img.width * scale)
+        height = round(base_img.height * scale)
+    width = width or base_img.width
+    height = height or base_img.height
+
+    source = base_img.convert("RGB")
+    if source.size != (width, height):
+        source = source.resize((width, height), Image.Resampling.LANCZOS)
+    output = Image.new("RGB", (width, height))
+
+    boxes = tile_boxes(width, height, tile_size, overlap)
+    kwargs["batch_size"] = 1
+
+    def run_tile(box):
+        tile = source.crop(box)
+        tw, th = tile.size
+        result = client.img2img(tile, prompt, width=_round8(tw), height=_round8(th), **kwargs)[0]
+        if result.size != tile.size:
+            result = result.resize(tile.size, Image.Resampling.LANCZOS)
+        return result.convert("RGB")
+
+    # results have to be pasted in row-major order for the feathering to line up,
+    # so only a small window of tiles is ever waiting to be pasted
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        next_box = 0
+        for index, box in enumerate(boxes):
+            while next_box < len(boxes) and len(pending) < max_workers * 2:
+                pending.append(executor.submit(run_tile, boxes[next_box]))
+                next_box += 1
+
+            result = pending.popleft().result()
+            left_overlap = 0
+            top_overlap = 0
+            if index > 0 and boxes[index - 1][1] == box[1]:
+                left_overlap = boxes[index - 1][2] - box[0]
+            if box[1] > 0:
+                top_overlap = max(b[3] for b in boxes if b[1] < box[1]) - box[1]
+            output.paste(result, box[:2], feather_mask(box, left_overlap, top_overlap))
+
+            if on_tile is not None:
+                on_tile(index + 1, len(boxes))
+
+    return output
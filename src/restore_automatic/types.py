@@ -1,17 +1,92 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class SDProgress:
     progress: float
     eta_relative: float
+    task_id: str | None = None
+    active: bool = False
+    queued: bool = False
+    completed: bool = False
+    textinfo: str | None = None
+    id_live_preview: int = -1
+    # decoded pillow image, only filled in for subscribers that asked for previews
+    live_preview: object = None
+    # no progress for longer than the monitor's stall timeout while active
+    stalled: bool = False
+
+
+class Routes:
+    MODELS = "/sdapi/v1/sd-models"
+    PROGRESS = "/internal/progress"
+    # server wide state, what is running and how much of it is left
+    STATE = "/sdapi/v1/progress?skip_current_image=true"
+    OPTIONS = "/sdapi/v1/options"
+    INTERRUPT = "/sdapi/v1/interrupt"
+
+    TXT2IMG = "/sdapi/v1/txt2img"
+    IMG2IMG = "/sdapi/v1/img2img"
 
 
 class EndPoints:
     BASE = "http://127.0.0.1:7860"
-    MODELS = BASE + "/sdapi/v1/sd-models"
-    PROGRESS = BASE + "/internal/progress"
-    OPTIONS = BASE + "/sdapi/v1/options"
-    INTERRUPT = BASE + "/sdapi/v1/interrupt"
+    MODELS = BASE + Routes.MODELS
+    PROGRESS = BASE + Routes.PROGRESS
+    STATE = BASE + Routes.STATE
+    OPTIONS = BASE + Routes.OPTIONS
+    INTERRUPT = BASE + Routes.INTERRUPT
     
-    TXT2IMG = BASE + "/sdapi/v1/txt2img"
-    IMG2IMG = BASE + "/sdapi/v1/img2img"
+    TXT2IMG = BASE + Routes.TXT2IMG
+    IMG2IMG = BASE + Routes.IMG2IMG
+
+
+@dataclass
+class Preset:
+    prompt: str
+    negative_prompt: str
+    denoising_strength: float
+    steps: int = 20
+    cfg_scale: float = 7.5
+
+
+@dataclass
+class UpscalePass:
+    """One img2img pass of a progressive upscale, `scale` is relative to the previous pass"""
+    scale: float
+    denoising_strength: float
+    steps: int = 20
+    # None keeps whatever cfg_scale the pipeline was called with
+    cfg_scale: float | None = None
+    # also decode and return this pass's output, not only the final one
+    keep: bool = False
+
+
+@dataclass
+class EncodeOptions:
+    # "PNG" or "WEBP", both lossless
+    format: str = "PNG"
+    # zlib level 0-9, Pillow defaults to 6 which is several times slower than 1 for
+    # barely smaller files, and the upload is usually cheaper than the CPU time
+    compress_level: int = 1
+    # WebP effort 0-6
+    webp_method: int = 0
+    # send the bytes of the file an image was opened from instead of re-encoding it,
+    # only safe when the image hasn't been modified since it was opened
+    passthrough: bool = False
+
+
+@dataclass
+class EncodedImage:
+    data: str = field(repr=False)
+    format: str
+    size: int
+    seconds: float
+
+
+@dataclass(frozen=True)
+class SDModel:
+    title: str
+    model_name: str
+    hash: str | None = None
+    sha256: str | None = None
+    filename: str | None = None
@@ -1,6 +1,14 @@
+from __future__ import annotations
 import base64
-from PIL import Image
+import os
+import time
 import io
+from typing import TYPE_CHECKING
+from .types import EncodeOptions, EncodedImage
+
+if TYPE_CHECKING:
+    # pillow is only imported once an image is actually opened
+    from PIL import Image
 
 
 DEFAULT_RESTORE_PROMPT = "realistic, clean, clear, ultra-sharp, super sharp, high-res, DSLR quality, high-quality"
@@ -26,15 +34,48 @@ def save_image(img, path) -> None:
     with open(path, "wb") as f:
         f.write(img)
 
+def bytes_to_pillowimg(image_bytes: bytes) -> Image.Image:
+    """Opens encoded image bytes as a pillow image"""
+    from PIL import Image
+    return Image.open(io.BytesIO(image_bytes))
+
 def base64_to_pillowimg(b64_str) -> Image.Image:
     """Converts base64 string into pillow image"""
+    from PIL import Image
     img = base64_to_bytes(b64_str)
     return Image.open(img)
 
-def pillowimg_to_base64(img: Image.Image):
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    img_byte = buffered.getvalue()
-    img_base64 = base64.b64encode(img_byte)
-    img_base64_string = img_base64.decode()
-    return img_base64_string
\ No newline at end of file
+def pillowimg_to_base64(img: Image.Image, options: EncodeOptions = None) -> str:
+    """Converts pillow image into base64 string"""
+    return encode_image(img, options).data
+
+def encode_image(img: str | Image.Image, options: EncodeOptions = None) -> EncodedImage:
+    """Encodes a file path or pillow image into base64 and reports how long it took"""
+    options = options or EncodeOptions()
+    start = time.perf_counter()
+
+    source_path = img if type(img) == str else None
+    if source_path is None and options.passthrough:
+        filename = getattr(img, "filename", "")
+        if filename and os.path.isfile(filename):
+            source_path = filename
+
+    if source_path is not None:
+        with open(source_path, "rb") as image_file:
+            raw = image_file.read()
+        fmt = os.path.splitext(source_path)[1][1:].upper()
+    else:
+        buffered = io.BytesIO()
+        if options.format.upper() == "WEBP":
+            img.save(buffered, format="WEBP", lossless=True, quality=0, method=options.webp_method)
+        else:
+            img.save(buffered, format="PNG", compress_level=options.compress_level)
+        # getbuffer() hands the encoder a view instead of copying the whole file out first
+        raw = buffered.getbuffer()
+        fmt = options.format.upper()
+
+    data = base64.b64encode(raw).decode("ascii")
+    size = len(raw)
+    if isinstance(raw, memoryview):
+        raw.release()
+    return EncodedImage(data, fmt, size, time.perf_counter() - start)
\ No newline at end of file
@@ -0,0 +1,37 @@
+import threading
+import pytest
+from restore_automatic.model_queue import ModelAffinityQueue
+
+
+class StubClient:
+    """Stands in for SDClient, every checkpoint swap fails and `txt2img` waits for `release`"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.switches = []
+
+    def set_model(self, model_name, CLIP_stop_at_last_layers=None):
+        self.switches.append(model_name)
+        raise RuntimeError(f"Could not set model {model_name}")
+
+    def txt2img(self, prompt, **kwargs):
+        self.release.wait(5)
+        return [prompt]
+
+
+def test_cancelled_job_and_failed_model_switch():
+    client = StubClient()
+    with ModelAffinityQueue(client) as queue:
+        running = queue.txt2img("first")
+        cancelled = queue.txt2img("cancelled", model_name="fake-v2")
+        assert cancelled.cancel()
+        failing = queue.txt2img("failing", model_name="fake-v3")
+        client.release.set()
+
+        assert running.result(5) == ["first"]
+        with pytest.raises(RuntimeError):
+            failing.result(5)
+        # the dispatcher has to survive both, and no swap is made for the cancelled job
+        assert queue.txt2img("after").result(5) == ["after"]
+        assert client.switches == ["fake-v3"]
+        assert cancelled.cancelled()
@@ -0,0 +1,15 @@
+import pytest
+from restore_automatic.tiling import tile_boxes
+
+
+def test_tiles_cover_the_image():
+    boxes = tile_boxes(1200, 700, tile_size=512, overlap=64)
+    assert boxes[0][:2] == (0, 0)
+    assert boxes[-1][2:] == (1200, 700)
+    assert all(r - l == 512 and b - t == 512 for l, t, r, b in boxes)
+
+
+@pytest.mark.parametrize("tile_size, overlap", [(0, 0), (-512, 64), (512, 512), (512, 600), (512, -1)])
+def test_rejects_tiling_that_cannot_advance(tile_size, overlap):
+    with pytest.raises(ValueError):
+        tile_boxes(2048, 2048, tile_size, overlap)